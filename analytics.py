@@ -0,0 +1,254 @@
+"""
+Sales analytics rollups
+Revenue, units and order counts per day, per category and per product, kept in the
+Analytics table (rollup + key) so dashboards read a few small partitions, never Orders.
+Orders are added incrementally by the order workers into write-sharded partitions
+(rollup#shard) so busy days and products are not one hot item; reads merge the shards.
+rebuild() recomputes everything in bulk with NumPy from a stream of order lines.
+Run: python analytics.py rebuild [--from-export exports/2026-03]
+"""
+from aws_dynamodb import dynamodb_manager
+from order_rollups import flatten_orders, apply_order_once, chunks_by_order, rebuild_main
+from config import Config
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from decimal import Decimal
+import logging
+import random
+import threading
+import time
+import zlib
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_FIELDS = {'day': 'day', 'category': 'category', 'product': 'product_id'}  # rollup -> line field
+ROLLUPS = tuple(ROLLUP_FIELDS)
+APPLIED_ROLLUP = 'applied'      # marker items making incremental updates idempotent
+
+
+def rollup_partitions(rollup):
+    """Partitions holding one rollup: the unsharded one rebuilds write, then each write shard"""
+    return [rollup] + [f"{rollup}#{shard}" for shard in range(Config.ANALYTICS_WRITE_SHARDS)]
+
+
+def applied_partition(order_id):
+    """Marker partition for an order: spread over the write shards, stable across retries"""
+    return f"{APPLIED_ROLLUP}#{zlib.crc32(order_id.encode()) % Config.ANALYTICS_WRITE_SHARDS}"
+
+
+class SalesAnalytics:
+    """Incremental and bulk-rebuilt rollups, with a short in-process read cache"""
+
+    def __init__(self, cache_ttl):
+        self.cache_ttl = cache_ttl
+        self._serializer = TypeSerializer()
+        self._cache = {}  # (rollup, since, until) -> (expires_at, rows)
+        self._lock = threading.Lock()
+
+    def _table(self):
+        return dynamodb_manager.dynamodb_resource.Table(Config.DYNAMODB_ANALYTICS_TABLE)
+
+    def _serialize(self, value):
+        return {k: self._serializer.serialize(v) for k, v in value.items()}
+
+    # Incremental updates
+
+    def record_order(self, order):
+        """
+        Add one order to the rollups. Each transaction also writes an 'applied' marker,
+        so replaying the same order (worker retry) never counts it twice. Increments go
+        to a random write shard, re-drawn when the transaction conflicts.
+        """
+        totals = {}  # (rollup, key) -> [revenue, units]
+        for line in flatten_orders([order]):
+            for rollup, field in ROLLUP_FIELDS.items():
+                entry = totals.setdefault((rollup, line[field]), [0.0, 0])
+                entry[0] += line['revenue']
+                entry[1] += line['quantity']
+
+        def increments(chunk):
+            shard = random.randrange(Config.ANALYTICS_WRITE_SHARDS)
+            return [
+                {
+                    'Update': {
+                        'TableName': Config.DYNAMODB_ANALYTICS_TABLE,
+                        'Key': self._serialize({'rollup': f"{rollup}#{shard}", 'key': key}),
+                        'UpdateExpression': 'ADD revenue :revenue, units :units, orders :one',
+                        'ExpressionAttributeValues': self._serialize({
+                            ':revenue': Decimal(str(round(revenue, 2))), ':units': units, ':one': 1
+                        })
+                    }
+                }
+                for (rollup, key), (revenue, units) in chunk
+            ]
+
+        order_id = order['order_id']
+        applied = apply_order_once(
+            Config.DYNAMODB_ANALYTICS_TABLE,
+            lambda part: {'rollup': applied_partition(order_id), 'key': f"{order_id}#{part}"},
+            list(totals.items()),
+            increments
+        )
+
+        if applied:
+            self._invalidate()
+        return applied
+
+    # Reads
+
+    def _invalidate(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_rollup(self, rollup, since=None, until=None):
+        """
+        Rows of one rollup ({key, revenue, units, orders}), merged across its write
+        shards and sorted by key; day keys filter by since/until
+        """
+        cache_key = (rollup, since, until)
+        with self._lock:
+            cached = self._cache.get(cache_key)
+            if cached and cached[0] > time.monotonic():
+                return cached[1]
+
+        merged = {}
+        for partition in rollup_partitions(rollup):
+            condition = Key('rollup').eq(partition)
+            if since and until:
+                condition &= Key('key').between(since, until)
+            elif since:
+                condition &= Key('key').gte(since)
+            elif until:
+                condition &= Key('key').lte(until)
+
+            for page in dynamodb_manager.iter_pages(self._table().query, KeyConditionExpression=condition):
+                for item in page:
+                    row = merged.setdefault(item['key'], {'key': item['key'], 'revenue': 0.0, 'units': 0, 'orders': 0})
+                    row['revenue'] += float(item.get('revenue', 0))
+                    row['units'] += int(item.get('units', 0))
+                    row['orders'] += int(item.get('orders', 0))
+        rows = [merged[key] for key in sorted(merged)]
+
+        with self._lock:
+            self._cache[cache_key] = (time.monotonic() + self.cache_ttl, rows)
+        return rows
+
+    def summary(self, since=None, until=None, top=10):
+        """
+        Dashboard payload: totals and daily series for the range, plus all-time revenue by
+        category and top products (those rollups are not kept per day, so they ignore the range)
+        """
+        days = self.get_rollup('day', since, until)
+        categories = sorted(self.get_rollup('category'), key=lambda row: -row['revenue'])
+        products = sorted(self.get_rollup('product'), key=lambda row: -row['revenue'])[:top]
+
+        return {
+            'totals': {
+                'revenue': sum(row['revenue'] for row in days),
+                'units': sum(row['units'] for row in days),
+                'orders': sum(row['orders'] for row in days)
+            },
+            'days': days,
+            'all_time': {
+                'categories': categories,
+                'top_products': products
+            }
+        }
+
+    # Bulk rebuild
+
+    def rebuild(self, lines):
+        """
+        Recompute every rollup from a stream of order lines (see order_lines), vectorised
+        per order-aligned chunk so memory stays bounded, and replace the stored rollups.
+        Lines of one order must be adjacent, as flatten_orders() yields them.
+        Stop the order workers while this runs, or their increments may be lost.
+        """
+        totals = {rollup: {} for rollup in ROLLUPS}
+        line_count = 0
+
+        # Chunks cut only between orders, so per-chunk distinct order counts add up
+        for chunk in chunks_by_order(lines):
+            self._aggregate(chunk, totals)
+            line_count += len(chunk)
+
+        written = self._replace(totals)
+        self._invalidate()
+        logger.info(f"Analytics rebuilt from {line_count} order lines ({written} rollup rows)")
+        return written
+
+    @staticmethod
+    def _aggregate(lines, totals):
+        """Add a chunk of order lines to totals with np.unique/np.bincount group-bys"""
+        if not lines:
+            return
+
+        revenue = np.fromiter((line['revenue'] for line in lines), dtype=np.float64, count=len(lines))
+        units = np.fromiter((line['quantity'] for line in lines), dtype=np.int64, count=len(lines))
+        order_ids, order_codes = np.unique(np.array([line['order_id'] for line in lines], dtype=object),
+                                           return_inverse=True)
+        n_orders = len(order_ids)
+
+        for rollup, field in ROLLUP_FIELDS.items():
+            keys, codes = np.unique(np.array([line[field] for line in lines], dtype=object),
+                                    return_inverse=True)
+            revenue_sums = np.bincount(codes, weights=revenue, minlength=len(keys))
+            unit_sums = np.bincount(codes, weights=units, minlength=len(keys))
+            # Distinct (key, order) pairs, so an order with two lines in a category counts once
+            pairs = np.unique(codes.astype(np.int64) * n_orders + order_codes)
+            order_counts = np.bincount(pairs // n_orders, minlength=len(keys))
+
+            rollup_totals = totals[rollup]
+            for key, key_revenue, key_units, key_orders in zip(keys, revenue_sums, unit_sums, order_counts):
+                entry = rollup_totals.setdefault(key, [0.0, 0, 0])
+                entry[0] += float(key_revenue)
+                entry[1] += int(key_units)
+                entry[2] += int(key_orders)
+
+    def _replace(self, totals):
+        """
+        Overwrite stored rollups with totals in the unsharded partitions, delete rows
+        that no longer exist, and empty the write shards (their increments are in totals)
+        """
+        table = self._table()
+        written = 0
+
+        with table.batch_writer(overwrite_by_pkeys=['rollup', 'key']) as batch:
+            for rollup in ROLLUPS:
+                existing = set()
+                for partition in rollup_partitions(rollup):
+                    for page in dynamodb_manager.iter_pages(
+                        table.query,
+                        KeyConditionExpression=Key('rollup').eq(partition),
+                        ProjectionExpression='#k',
+                        ExpressionAttributeNames={'#k': 'key'}
+                    ):
+                        existing.update((partition, item['key']) for item in page)
+
+                for key, (revenue, units, orders) in totals[rollup].items():
+                    batch.put_item(Item={
+                        'rollup': rollup,
+                        'key': key,
+                        'revenue': Decimal(str(round(revenue, 2))),
+                        'units': units,
+                        'orders': orders
+                    })
+                    written += 1
+
+                for partition, key in existing - {(rollup, key) for key in totals[rollup]}:
+                    batch.delete_item(Key={'rollup': partition, 'key': key})
+
+        return written
+
+
+# Singleton instance
+sales_analytics = SalesAnalytics(cache_ttl=Config.ANALYTICS_CACHE_TTL)
+
+
+def main():
+    rebuild_main('Sales analytics rollups', 'analytics', sales_analytics.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,14 +3,31 @@ E-Commerce Flask Application
 Premium online store with AWS integration
 Users: RDS PostgreSQL | Products, Orders, Cart: DynamoDB
 """
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response
 from flask_cors import CORS
 from config import Config
 from aws_rds import rds_manager
-from aws_dynamodb import dynamodb_manager
+from aws_dynamodb import (
+    dynamodb_manager, encode_cursor, decode_cursor, project,
+    PRODUCT_FIELDS, PRODUCT_KEY, ORDER_FIELDS, ORDER_SUMMARY_FIELDS, CART_OPS, OutOfStockError
+)
+from search_index import search_index
+from product_suggest import suggest_index, DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS
+from product_facets import facet_index
+from price_index import price_index
+from order_queue import order_queue, CHECKOUT_DELAY_SECONDS
+from idempotency import idempotent
+from order_ids import new_order_id
+from analytics import sales_analytics
+from recommendations import recommendations
 from auth import AuthManager, token_required, optional_token, validate_email, validate_password
 import logging
-from datetime import datetime
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import gzip
+import hashlib
+import threading
+import time
 import uuid
 
 # Configure logging
@@ -36,7 +53,7 @@ def initialize_databases():
         logger.info("Creating RDS tables (Users)...")
         rds_manager.create_tables_if_not_exist()
         
-        logger.info("Creating DynamoDB tables (Products, Orders, Cart)...")
+        logger.info("Creating DynamoDB tables (Products, Orders, Cart, Inventory)...")
         dynamodb_manager.create_tables_if_not_exist()
         
         # Auto-seed products if empty
@@ -59,6 +76,122 @@ def initialize_databases():
         logger.warning("App will start but database operations may fail")
 
 
+def _parse_limit(value):
+    """Parse a ?limit= page size, defaulting to ITEMS_PER_PAGE and capped at MAX_PAGE_SIZE"""
+    if value is None or value == '':
+        return Config.ITEMS_PER_PAGE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit < 1:
+        raise ValueError("limit must be at least 1")
+    return min(limit, Config.MAX_PAGE_SIZE)
+
+
+def _parse_price(name):
+    """Parse an optional ?min_price= / ?max_price= bound"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} must be a number")
+
+
+def _parse_date(name):
+    """Parse an optional ISO date/datetime query parameter (?since=2026-03-01)"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO date, e.g. 2026-03-01")
+
+
+def _parse_offset_cursor(cursor):
+    """Decode a cursor from an in-memory index listing into an offset"""
+    position = decode_cursor(cursor) or {}
+    offset = position.get('offset', 0)
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError("Invalid cursor")
+    return offset
+
+
+def _parse_fields(allowed):
+    """Parse a ?fields=a,b,c sparse fieldset; returns a tuple of field names or None"""
+    value = request.args.get('fields')
+    if not value:
+        return None
+    
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields or None
+
+
+# Serialized /api/products responses, LRU like the catalog cache:
+# (category, fields) -> (version, built_at, etag, body, gzipped body)
+_catalog_payloads = OrderedDict()
+_catalog_payloads_lock = threading.Lock()
+
+
+def _catalog_payload(category, fields=None):
+    """Return (etag, body, gzipped body) for a catalog listing, rebuilding only when the catalog changed"""
+    cache = dynamodb_manager.catalog_cache
+    
+    key = (category, fields)
+    
+    with _catalog_payloads_lock:
+        cached = _catalog_payloads.get(key)
+        if cached:
+            _catalog_payloads.move_to_end(key)
+    if (cached and cache.enabled and cached[0] == (cache.version, cache.fill_version(category))
+            and time.monotonic() - cached[1] < cache.ttl_seconds):
+        return cached[2:]
+    
+    # Patch version first, so a write racing this build leaves the payload stale;
+    # fill version after, so the cache fill done by this very read does not
+    patched = cache.version
+    products = dynamodb_manager.get_all_products(category=category, fields=fields)
+    version = (patched, cache.fill_version(category))
+    body = app.json.dumps({
+        'success': True,
+        'data': products,
+        'count': len(products)
+    }).encode('utf-8')
+    etag = hashlib.sha1(body).hexdigest()[:20]
+    gzipped = gzip.compress(body, compresslevel=6, mtime=0)
+    
+    with _catalog_payloads_lock:
+        _catalog_payloads[key] = (version, time.monotonic(), etag, body, gzipped)
+        _catalog_payloads.move_to_end(key)
+        while len(_catalog_payloads) > Config.PRODUCT_CACHE_MAX_ENTRIES:
+            _catalog_payloads.popitem(last=False)
+    return etag, body, gzipped
+
+
+def _catalog_response(category, fields=None):
+    """Serve a catalog listing from pre-serialized bytes, with ETag/304 and gzip support"""
+    etag, body, gzipped = _catalog_payload(category, fields)
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    elif 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(gzipped, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(body, mimetype='application/json')
+    
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+
 # ==================== PAGES ====================
 
 @app.route('/')
@@ -271,10 +404,102 @@ def verify_token(current_user):
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
-    """Get all products (public endpoint)"""
+    """Get all products, or one page when limit/cursor is given (public endpoint)"""
     try:
         category = request.args.get('category')
-        products = dynamodb_manager.get_all_products(category=category)
+        
+        try:
+            fields = _parse_fields(PRODUCT_FIELDS)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if any(arg in request.args for arg in ('min_price', 'max_price', 'sort')):
+            # Range filters and sorting are answered from the in-memory price index
+            try:
+                limit = _parse_limit(request.args.get('limit'))
+                offset = _parse_offset_cursor(request.args.get('cursor'))
+                products, total = price_index.query(
+                    category=category,
+                    min_price=_parse_price('min_price'),
+                    max_price=_parse_price('max_price'),
+                    sort=request.args.get('sort') or 'price_asc',
+                    offset=offset,
+                    limit=limit
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            if fields:
+                products = project(products, fields, PRODUCT_KEY)
+            next_offset = offset + len(products)
+            
+            return jsonify({
+                'success': True,
+                'data': products,
+                'count': len(products),
+                'total': total,
+                'next_cursor': encode_cursor({'offset': next_offset}) if next_offset < total else None
+            })
+        
+        if 'limit' in request.args or 'cursor' in request.args:
+            try:
+                limit = _parse_limit(request.args.get('limit'))
+                products, next_cursor = dynamodb_manager.get_products_page(
+                    category=category,
+                    limit=limit,
+                    cursor=request.args.get('cursor'),
+                    fields=fields
+                )
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+            
+            return jsonify({
+                'success': True,
+                'data': products,
+                'count': len(products),
+                'next_cursor': next_cursor
+            })
+        
+        return _catalog_response(category, fields)
+        
+    except Exception as e:
+        logger.error(f"Error getting products: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    """Full-text product search ranked by relevance (public endpoint)"""
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({
+                'success': False,
+                'error': 'q is required'
+            }), 400
+        
+        try:
+            limit = _parse_limit(request.args.get('limit'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        results = search_index.search(query, limit=limit, category=request.args.get('category'))
+        products = [dict(product, score=round(score, 4)) for product, score in results]
         
         return jsonify({
             'success': True,
@@ -283,7 +508,98 @@ def get_products():
         })
         
     except Exception as e:
-        logger.error(f"Error getting products: {e}")
+        logger.error(f"Error searching products: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/products/suggest', methods=['GET'])
+def suggest_products():
+    """Typeahead suggestions for product names and categories (public endpoint)"""
+    try:
+        try:
+            limit = min(int(request.args.get('limit', DEFAULT_SUGGESTIONS)), MAX_SUGGESTIONS)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'limit must be an integer'
+            }), 400
+        
+        suggestions = suggest_index.suggest(request.args.get('prefix', ''), limit=max(limit, 1))
+        
+        response = jsonify({
+            'success': True,
+            'data': suggestions,
+            'count': len(suggestions)
+        })
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error suggesting products: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/products/facets', methods=['GET'])
+def get_product_facets():
+    """Category counts and price histograms for the filter sidebar (public endpoint)"""
+    try:
+        return jsonify({
+            'success': True,
+            'data': facet_index.facets()
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting product facets: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/products/batch', methods=['POST'])
+def get_products_batch():
+    """Get several products in one round trip, e.g. to revalidate a cart (public endpoint)"""
+    try:
+        data = request.get_json() or {}
+        product_ids = data.get('product_ids')
+        
+        if not isinstance(product_ids, list) or not all(isinstance(p, str) for p in product_ids):
+            return jsonify({
+                'success': False,
+                'error': 'product_ids must be a list of strings'
+            }), 400
+        
+        if len(product_ids) > Config.MAX_BATCH_PRODUCTS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {Config.MAX_BATCH_PRODUCTS} product_ids per request'
+            }), 400
+        
+        try:
+            fields = _parse_fields(PRODUCT_FIELDS)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        products, missing = dynamodb_manager.get_products_batch(product_ids, fields=fields)
+        
+        return jsonify({
+            'success': True,
+            'data': products,
+            'count': len(products),
+            'missing': missing
+        })
+        
+    except Exception as e:
+        logger.error(f"Error batch getting products: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -294,7 +610,15 @@ def get_products():
 def get_product(product_id):
     """Get single product details (public endpoint)"""
     try:
-        product = dynamodb_manager.get_product(product_id)
+        try:
+            fields = _parse_fields(PRODUCT_FIELDS)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        product = dynamodb_manager.get_product(product_id, fields=fields)
         
         if not product:
             return jsonify({
@@ -302,6 +626,10 @@ def get_product(product_id):
                 'error': 'Product not found'
             }), 404
         
+        if 'stock' in product and dynamodb_manager.inventory.shard_count(product_id):
+            # Products.stock trails the shards; report their (briefly cached) sum
+            product['stock'] = dynamodb_manager.inventory.get_stock(product_id)
+        
         return jsonify({
             'success': True,
             'data': product
@@ -315,6 +643,42 @@ def get_product(product_id):
         }), 500
 
 
+@app.route('/api/products/<product_id>/related', methods=['GET'])
+def get_related_products(product_id):
+    """Products most often bought together with this one (public endpoint)"""
+    try:
+        try:
+            limit = _parse_limit(request.args.get('limit') or '8')
+            fields = _parse_fields(PRODUCT_FIELDS)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Ask for a few extra neighbours in case some were deleted since the last rebuild
+        neighbours = recommendations.related(product_id, limit=limit * 2)
+        products = []
+        if neighbours:
+            co_purchases = dict(neighbours)
+            found, _ = dynamodb_manager.get_products_batch(list(co_purchases), fields=fields)
+            products = [dict(product, co_purchases=co_purchases[product['product_id']])
+                        for product in found[:limit]]
+        
+        return jsonify({
+            'success': True,
+            'data': products,
+            'count': len(products)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting related products: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 # ==================== PRODUCTS MANAGEMENT (ADMIN) ====================
 
 @app.route('/api/admin/products', methods=['POST'])
@@ -366,7 +730,16 @@ def update_product(current_user, product_id):
     try:
         data = request.get_json()
         
-        product = dynamodb_manager.update_product(product_id, **data)
+        # Keys are resolved server-side; category cannot be changed in place
+        fields = {k: v for k, v in data.items() if k not in ('product_id', 'category')}
+        
+        product = dynamodb_manager.update_product(product_id, **fields)
+        
+        if not product:
+            return jsonify({
+                'success': False,
+                'error': 'Product not found'
+            }), 404
         
         return jsonify({
             'success': True,
@@ -408,6 +781,147 @@ def delete_product(current_user, product_id):
         }), 500
 
 
+@app.route('/api/admin/inventory/<product_id>', methods=['GET'])
+@token_required
+def get_inventory_shards(current_user, product_id):
+    """Show a product's stock shards (admin only)"""
+    try:
+        shards = dynamodb_manager.inventory.read_shards(product_id, consistent=True)
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'product_id': product_id,
+                'sharded': bool(shards),
+                'stock': sum(shards.values()),
+                'shards': [{'shard': shard, 'stock': stock} for shard, stock in sorted(shards.items())]
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting inventory shards: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/admin/inventory/<product_id>/shards', methods=['POST'])
+@token_required
+def enable_inventory_shards(current_user, product_id):
+    """Split a hot product's stock across shards before a flash sale (admin only)"""
+    try:
+        data = request.get_json() or {}
+        
+        try:
+            counts = dynamodb_manager.inventory.enable(product_id, int(data.get('shards', 10)))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        if counts is None:
+            return jsonify({
+                'success': False,
+                'error': 'Product not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {'product_id': product_id, 'stock': sum(counts), 'shards': counts},
+            'message': f'Stock split across {len(counts)} shards'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error sharding inventory: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/admin/inventory/<product_id>/shards', methods=['DELETE'])
+@token_required
+def disable_inventory_shards(current_user, product_id):
+    """Fold a product's shards back into a single stock counter (admin only)"""
+    try:
+        try:
+            total = dynamodb_manager.inventory.disable(product_id)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 409
+        
+        if total is None:
+            return jsonify({
+                'success': False,
+                'error': 'Product is not sharded'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {'product_id': product_id, 'stock': total},
+            'message': 'Stock shards merged'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error unsharding inventory: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/admin/analytics', methods=['GET'])
+@token_required
+def get_sales_analytics(current_user):
+    """Sales rollups: daily series (?since=, ?until= exclusive), all-time categories and top products (admin only)"""
+    try:
+        try:
+            since = _parse_date('since')
+            until = _parse_date('until')
+            top = _parse_limit(request.args.get('top') or '10')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        # Day rollups are keyed by ISO date, so the range is a key range on the rollup partition.
+        # Bounds widen to whole days: a non-midnight until keeps the day it falls in
+        last_day = None
+        if until:
+            last_day = until.date() if until.time() != datetime.min.time() else until.date() - timedelta(days=1)
+        report = sales_analytics.summary(
+            since=since.date().isoformat() if since else None,
+            until=last_day.isoformat() if last_day else None,
+            top=top
+        )
+        
+        top_products = report['all_time']['top_products']
+        names = {}
+        if top_products:
+            products, _ = dynamodb_manager.get_products_batch(
+                [row['key'] for row in top_products], fields=('name',)
+            )
+            names = {product['product_id']: product.get('name') for product in products}
+        report['all_time']['top_products'] = [dict(row, name=names.get(row['key'])) for row in top_products]
+        
+        return jsonify({
+            'success': True,
+            'data': report
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting analytics: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 # ==================== CART ENDPOINTS ====================
 
 @app.route('/api/cart', methods=['GET'])
@@ -438,6 +952,7 @@ def get_cart(current_user):
 
 @app.route('/api/cart', methods=['POST'])
 @token_required
+@idempotent
 def save_cart(current_user):
     """Save cart items"""
     try:
@@ -468,6 +983,51 @@ def save_cart(current_user):
         }), 500
 
 
+@app.route('/api/cart/items/<product_id>', methods=['PATCH'])
+@token_required
+def update_cart_item(current_user, product_id):
+    """Add to, set the quantity of, or remove a single cart line"""
+    try:
+        data = request.get_json() or {}
+        
+        op = data.get('op', 'add')
+        if op not in CART_OPS:
+            return jsonify({
+                'success': False,
+                'error': f"op must be one of: {', '.join(CART_OPS)}"
+            }), 400
+        
+        quantity = data.get('quantity', 1)
+        if isinstance(quantity, bool) or not isinstance(quantity, int):
+            return jsonify({
+                'success': False,
+                'error': 'quantity must be an integer'
+            }), 400
+        
+        details = {k: v for k, v in data.items() if k not in ('op', 'quantity', 'product_id')}
+        
+        cart = dynamodb_manager.update_cart_item(
+            user_id=current_user['user_id'],
+            product_id=product_id,
+            op=op,
+            quantity=quantity,
+            details=details
+        )
+        
+        return jsonify({
+            'success': True,
+            'data': cart or {'items': []},
+            'message': 'Cart updated successfully'
+        })
+        
+    except Exception as e:
+        logger.error(f"Error updating cart item: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 @app.route('/api/cart', methods=['DELETE'])
 @token_required
 def clear_cart(current_user):
@@ -492,6 +1052,7 @@ def clear_cart(current_user):
 
 @app.route('/api/orders', methods=['POST'])
 @token_required
+@idempotent
 def create_order(current_user):
     """Create a new order (checkout)"""
     try:
@@ -505,19 +1066,42 @@ def create_order(current_user):
                     'error': f'{field} is required'
                 }), 400
         
-        order_id = f"ORD-{uuid.uuid4().hex[:12].upper()}"
+        order_id = new_order_id()  # Time-ordered, so the Orders sort key is chronological
         
-        order = dynamodb_manager.create_order(
-            order_id=order_id,
-            user_id=current_user['user_id'],
-            items=data['items'],
-            total_amount=data['total_amount'],
-            shipping_address=data['shipping_address'],
-            status='pending'
-        )
+        # Post-order steps run in order_worker.py. The job is queued first, so every
+        # committed order has one; workers retry a job whose order is not written yet
+        try:
+            order_queue.enqueue(current_user['user_id'], order_id, delay=CHECKOUT_DELAY_SECONDS)
+        except Exception as e:
+            logger.error(f"Error queueing order {order_id} for processing: {e}")
+            return jsonify({
+                'success': False,
+                'error': 'Orders cannot be accepted right now, please retry'
+            }), 503
         
-        # Clear cart after successful order
-        dynamodb_manager.clear_cart(current_user['user_id'])
+        # Order, stock decrements and cart removal commit together or not at all
+        try:
+            order = dynamodb_manager.checkout(
+                order_id=order_id,
+                user_id=current_user['user_id'],
+                items=data['items'],
+                total_amount=data['total_amount'],
+                shipping_address=data['shipping_address'],
+                status='pending'
+            )
+        except OutOfStockError as e:
+            order_queue.cancel(order_id)
+            return jsonify({
+                'success': False,
+                'error': 'Some items are out of stock',
+                'out_of_stock': e.items
+            }), 409
+        except ValueError as e:
+            order_queue.cancel(order_id)
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         return jsonify({
             'success': True,
@@ -536,14 +1120,36 @@ def create_order(current_user):
 @app.route('/api/orders', methods=['GET'])
 @token_required
 def get_user_orders(current_user):
-    """Get all orders for current user"""
+    """
+    Get one page of the current user's order summaries, newest first
+    (?limit=, ?cursor=, ?since=, ?until=, ?fields= for other attributes)
+    """
     try:
-        orders = dynamodb_manager.get_user_orders(current_user['user_id'])
+        try:
+            fields = _parse_fields(ORDER_FIELDS) or ORDER_SUMMARY_FIELDS
+            limit = _parse_limit(request.args.get('limit'))
+            since = _parse_date('since')
+            until = _parse_date('until')  # exclusive: ?since=2026-03-01&until=2026-04-01 is March
+            
+            orders, next_cursor = dynamodb_manager.get_user_orders_page(
+                current_user['user_id'],
+                limit=limit,
+                cursor=request.args.get('cursor'),
+                fields=fields,
+                since=since,
+                until=until
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         return jsonify({
             'success': True,
             'data': orders,
-            'count': len(orders)
+            'count': len(orders),
+            'next_cursor': next_cursor
         })
         
     except Exception as e:
@@ -554,6 +1160,32 @@ def get_user_orders(current_user):
         }), 500
 
 
+@app.route('/api/orders/<order_id>', methods=['GET'])
+@token_required
+def get_order(current_user, order_id):
+    """Get one of the current user's orders with its items and shipping address"""
+    try:
+        order = dynamodb_manager.get_order(current_user['user_id'], order_id)
+        
+        if not order:
+            return jsonify({
+                'success': False,
+                'error': 'Order not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': order
+        })
+        
+    except Exception as e:
+        logger.error(f"Error getting order: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
 # ==================== HEALTH CHECK ====================
 
 @app.route('/health')
@@ -590,6 +1222,9 @@ if __name__ == '__main__':
     # Initialize databases
     initialize_databases()
     
+    # Warm the typeahead index in the background; suggest never waits on the catalog read
+    suggest_index.ensure_built(wait=False)
+    
     # Run Flask app
     logger.info(f"Starting E-Commerce app on {Config.HOST}:{Config.PORT}")
     app.run(
@@ -1,21 +1,40 @@
 """
 AWS DynamoDB utilities for E-Commerce Application
-Handles Products, Orders, and Cart (NO GSI - using sort keys)
+Handles Products, Orders, and Cart (sort keys; one category GSI on Products)
 Users are stored in RDS PostgreSQL
 """
 import boto3
 from boto3.dynamodb.conditions import Key, Attr
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 from botocore.exceptions import ClientError
 from config import Config
+from inventory import ShardedInventory
+from order_ids import order_id_bound
 import logging
 from decimal import Decimal
 import json
-from datetime import datetime
+import atexit
+import base64
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+class OutOfStockError(Exception):
+    """Raised when checkout cannot reserve stock; items lists the offending product ids"""
+    
+    def __init__(self, items):
+        self.items = items
+        super().__init__(f"Insufficient stock for: {', '.join(item['product_id'] for item in items)}")
+
+
 class DecimalEncoder(json.JSONEncoder):
     """Helper class to convert DynamoDB Decimal to JSON"""
     def default(self, obj):
@@ -24,6 +43,439 @@ class DecimalEncoder(json.JSONEncoder):
         return super(DecimalEncoder, self).default(obj)
 
 
+# Attributes clients may request with ?fields= (keys are always returned)
+PRODUCT_FIELDS = ('product_id', 'category', 'name', 'description', 'price', 'image_url', 'stock', 'created_at')
+ORDER_FIELDS = ('user_id', 'order_id', 'items', 'item_count', 'total_amount', 'shipping_address',
+                'status', 'created_at', 'updated_at')
+ORDER_SUMMARY_FIELDS = ('order_id', 'created_at', 'status', 'total_amount', 'item_count')
+
+PRODUCT_KEY = ('product_id', 'category')
+ORDER_KEY = ('user_id', 'order_id')
+
+BATCH_GET_SIZE = 100  # BatchGetItem key limit
+BATCH_MAX_RETRIES = 5
+BATCH_BACKOFF_SECONDS = 0.05
+CART_DISCARD_TIMEOUT_SECONDS = 10  # longest checkout waits for an in-flight cart write
+
+CATEGORY_LOOKUP_WORKERS = 8  # concurrent key-only Queries for unknown product ids
+CATEGORY_QUERY_LIMIT = 25  # past this many unknown ids, load the catalog listing instead
+MISSING_CATEGORY_TTL = 30  # seconds an id found not to exist is not looked up again
+MISSING_CATEGORY_MAX_ENTRIES = 10000
+
+
+BATCH_WRITE_SIZE = 25  # BatchWriteItem request limit
+
+TRANSACT_MAX_ITEMS = 100  # TransactWriteItems action limit
+CHECKOUT_ATTEMPTS = 4  # retries move sharded products to other shards
+CHECKOUT_RETRY_REASONS = ('TransactionConflict', 'ThrottlingError', 'ProvisionedThroughputExceeded')
+
+CART_OPS = ('add', 'set', 'remove')
+CART_UPDATE_RETRIES = 3
+
+
+def to_dynamo(value):
+    """Convert JSON-style data (floats) into DynamoDB-safe types (Decimal)"""
+    return json.loads(json.dumps(value, cls=DecimalEncoder), parse_float=Decimal)
+
+
+def _from_dynamo_number(value):
+    """Turn a DynamoDB Decimal back into an int or float for the API"""
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return value
+
+
+# Stored per cart line; display fields (name, image_url, ...) are filled from the catalog on read
+CART_LINE_FIELDS = ('quantity', 'price')
+CART_DISPLAY_FIELDS = ('name', 'image_url', 'category', 'stock')
+
+
+def order_item_count(items):
+    """Units in an order, stored as item_count so summaries never read the items list"""
+    return sum(int(line.get('quantity', 1)) for line in items or [])
+
+
+def compact_cart_line(line):
+    """Keep only quantity and the price at the time the product was added"""
+    return {k: line[k] for k in CART_LINE_FIELDS if line.get(k) is not None}
+
+
+def cart_items_to_map(items):
+    """Convert an API cart (list of lines) into the stored map keyed by product_id"""
+    lines = {}
+    for item in items or []:
+        product_id = item.get('product_id')
+        if product_id:
+            lines[product_id] = compact_cart_line(item)
+    return to_dynamo(lines)
+
+
+def cart_expires_at():
+    """Epoch seconds after which DynamoDB TTL may delete an untouched cart"""
+    return int(time.time()) + Config.CART_TTL_DAYS * 86400
+
+
+def cart_from_dynamo(item):
+    """Convert a stored cart into the API shape with items as a list"""
+    if not item:
+        return None
+
+    lines = item.get('items') or {}
+    if isinstance(lines, list):
+        # Carts saved before items became a map
+        lines = {line['product_id']: line for line in lines if line.get('product_id')}
+
+    items = []
+    for product_id, line in lines.items():
+        line = {k: _from_dynamo_number(v) for k, v in line.items()}
+        line['product_id'] = product_id
+        items.append(line)
+
+    cart = {k: _from_dynamo_number(v) for k, v in item.items()}
+    cart['items'] = items
+    return cart
+
+
+def order_from_dynamo(item):
+    """Convert a stored order (or order summary) into API types"""
+    if not item:
+        return item
+
+    order = {k: _from_dynamo_number(v) for k, v in item.items()}
+    if 'total_amount' in order:
+        order['total_amount'] = float(order['total_amount'])
+    if isinstance(order.get('items'), list):
+        order['items'] = [
+            {k: _from_dynamo_number(v) for k, v in line.items()} if isinstance(line, dict) else line
+            for line in order['items']
+        ]
+    return order
+
+
+def build_projection(fields, key_attributes):
+    """Build (ProjectionExpression, ExpressionAttributeNames) for fields plus the key attributes"""
+    attributes = list(key_attributes) + [f for f in fields if f not in key_attributes]
+    names = {f'#p{i}': attribute for i, attribute in enumerate(attributes)}
+    return ', '.join(names), names
+
+
+def project(items, fields, key_attributes):
+    """Apply a sparse fieldset in memory (for listings already held in the catalog cache)"""
+    wanted = list(key_attributes) + [f for f in fields if f not in key_attributes]
+    return [{f: item[f] for f in wanted if f in item} for item in items]
+
+
+def encode_cursor(last_evaluated_key):
+    """Encode a DynamoDB LastEvaluatedKey as an opaque URL-safe cursor"""
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, cls=DecimalEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor() back into an ExclusiveStartKey"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+class CatalogCache:
+    """In-process TTL cache for product listings, keyed by category (None = all products)"""
+    
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # category -> (expires_at, items)
+        self._by_id = {}  # product_id -> product, for the full listing
+        self._lock = threading.Lock()
+        self.version = 0  # bumped whenever cached products are patched (upsert/remove/stock/invalidate)
+        self._fills = {}  # category -> number of times that listing was stored
+    
+    @property
+    def enabled(self):
+        return self.ttl_seconds > 0 and self.max_entries > 0
+    
+    def get(self, category=None):
+        """Return a cached listing, or None on miss/expiry"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(category)
+            
+            # A category listing can be derived from a fresh full listing
+            if entry is None and category is not None:
+                full = self._entries.get(None)
+                if full and full[0] > time.monotonic():
+                    items = [p for p in full[1] if p.get('category') == category]
+                    return items
+            
+            if entry is None:
+                return None
+            
+            expires_at, items = entry
+            if expires_at <= time.monotonic():
+                del self._entries[category]
+                return None
+            
+            self._entries.move_to_end(category)
+            return list(items)
+    
+    def set(self, category, items):
+        """Store a listing, evicting the least recently used entries past the size limit"""
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._entries[category] = (time.monotonic() + self.ttl_seconds, list(items))
+            self._entries.move_to_end(category)
+            if category is None:
+                self._by_id = {p['product_id']: p for p in items if 'product_id' in p}
+            self._fills[category] = self._fills.get(category, 0) + 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def fill_version(self, category=None):
+        """Changes when the listing for category is stored again (or the full listing it derives from)"""
+        with self._lock:
+            return self._fills.get(category, 0), self._fills.get(None, 0)
+    
+    def upsert(self, product):
+        """Patch a created/updated product into every cached listing it belongs to"""
+        product_id = product.get('product_id')
+        
+        with self._lock:
+            for category, (expires_at, items) in list(self._entries.items()):
+                kept = [p for p in items if p.get('product_id') != product_id]
+                if category is None or category == product.get('category'):
+                    kept.append(product)
+                self._entries[category] = (expires_at, kept)
+            if None in self._entries:
+                self._by_id[product_id] = product
+            self.version += 1
+    
+    def remove(self, product_id):
+        """Drop a deleted product from every cached listing"""
+        with self._lock:
+            for category, (expires_at, items) in list(self._entries.items()):
+                kept = [p for p in items if p.get('product_id') != product_id]
+                self._entries[category] = (expires_at, kept)
+            self._by_id.pop(product_id, None)
+            self.version += 1
+    
+    def invalidate(self):
+        """Clear all cached listings"""
+        with self._lock:
+            self._entries.clear()
+            self._by_id = {}
+            self.version += 1
+    
+    def adjust_stock(self, product_id, delta):
+        """Apply a stock change to the cached copies of a product"""
+        with self._lock:
+            # upsert() shares one dict between the full and category listings; adjust each object once
+            products = {}
+            for category, (expires_at, items) in self._entries.items():
+                for p in items:
+                    if p.get('product_id') == product_id:
+                        products[id(p)] = p
+            product = self._by_id.get(product_id)
+            if product is not None:
+                products[id(product)] = product
+            
+            for product in products.values():
+                if product.get('stock') is not None:
+                    product['stock'] = product['stock'] + delta
+            self.version += 1
+    
+    def find(self, product_id):
+        """Look up one product in a fresh full listing, or None"""
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            full = self._entries.get(None)
+            if not full or full[0] <= time.monotonic():
+                return None
+            return self._by_id.get(product_id)
+
+
+class ProductCategoryIndex:
+    """In-memory product_id -> category map, so by-id lookups can build the full table key"""
+    
+    def __init__(self):
+        self._categories = {}
+        self._missing = OrderedDict()  # product_id -> expires_at, for ids that did not exist
+        self._lock = threading.Lock()
+    
+    def get(self, product_id):
+        with self._lock:
+            return self._categories.get(product_id)
+    
+    def set(self, product_id, category):
+        with self._lock:
+            self._categories[product_id] = category
+            self._missing.pop(product_id, None)
+    
+    def is_missing(self, product_id):
+        """True while a recent lookup found no product with this id"""
+        with self._lock:
+            expires_at = self._missing.get(product_id)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._missing[product_id]
+                return False
+            return True
+    
+    def mark_missing(self, product_id):
+        with self._lock:
+            self._missing[product_id] = time.monotonic() + MISSING_CATEGORY_TTL
+            self._missing.move_to_end(product_id)
+            while len(self._missing) > MISSING_CATEGORY_MAX_ENTRIES:
+                self._missing.popitem(last=False)
+    
+    def discard(self, product_id):
+        with self._lock:
+            self._categories.pop(product_id, None)
+    
+    def update_from(self, products):
+        """Record the category of every product in a listing"""
+        with self._lock:
+            for product in products:
+                if 'product_id' in product and 'category' in product:
+                    self._categories[product['product_id']] = product['category']
+                    self._missing.pop(product['product_id'], None)
+
+
+class CartWriteBuffer:
+    """
+    Write-behind buffer holding the latest cart per user (None = pending delete).
+    A background thread flushes it with BatchWriteItem every flush_interval seconds.
+    """
+    
+    def __init__(self, manager, max_entries, flush_interval):
+        self.manager = manager
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._pending = OrderedDict()  # user_id -> cart item or None
+        self._inflight = {}            # user_id -> cart item being written right now
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)  # notified when in-flight writes finish
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='cart-write-behind', daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+    
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing cart buffer: {e}")
+    
+    def put(self, user_id, item):
+        """Buffer the latest cart for a user (item=None buffers a delete)"""
+        with self._lock:
+            self._start()
+            self._pending[user_id] = item
+            self._pending.move_to_end(user_id)
+            full = len(self._pending) >= self.max_entries
+        
+        if full:
+            # Backpressure: a full buffer is flushed on the caller's thread
+            self.flush()
+    
+    def get(self, user_id):
+        """Return (found, item) for a buffered or in-flight cart"""
+        with self._lock:
+            if user_id in self._pending:
+                return True, self._pending[user_id]
+            if user_id in self._inflight:
+                return True, self._inflight[user_id]
+        return False, None
+    
+    def discard(self, user_id, timeout=CART_DISCARD_TIMEOUT_SECONDS):
+        """
+        Forget a buffered cart that is about to be written by other means (e.g. checkout).
+        Waits for a flush already writing the cart, so it cannot land afterwards;
+        raises RuntimeError if that write is still running after timeout seconds.
+        """
+        with self._lock:
+            if not self._written.wait_for(lambda: user_id not in self._inflight, timeout):
+                raise RuntimeError("Cart is still being saved, please retry")
+            # A failed flush re-queues the cart, so drop it only once the write is over
+            self._pending.pop(user_id, None)
+    
+    def flush(self, user_ids=None):
+        """Write buffered carts (all, or just user_ids) in BatchWriteItem chunks of 25"""
+        with self._flush_lock:
+            with self._lock:
+                wanted = self._pending.keys() if user_ids is None else [u for u in user_ids if u in self._pending]
+                batch = {user_id: self._pending[user_id] for user_id in list(wanted)}
+                for user_id in batch:
+                    del self._pending[user_id]
+                self._inflight.update(batch)
+            
+            if not batch:
+                return 0
+            
+            try:
+                self._write(batch)
+            except Exception:
+                with self._lock:
+                    # Re-queue carts that no newer save has superseded
+                    for user_id, item in batch.items():
+                        self._pending.setdefault(user_id, item)
+                raise
+            finally:
+                with self._lock:
+                    for user_id in batch:
+                        self._inflight.pop(user_id, None)
+                    self._written.notify_all()
+            
+            logger.info(f"Flushed {len(batch)} buffered carts")
+            return len(batch)
+    
+    def _write(self, batch):
+        table_name = Config.DYNAMODB_CART_TABLE
+        requests = [
+            {'PutRequest': {'Item': item}} if item is not None
+            else {'DeleteRequest': {'Key': {'user_id': user_id}}}
+            for user_id, item in batch.items()
+        ]
+        
+        for start in range(0, len(requests), BATCH_WRITE_SIZE):
+            request_items = {table_name: requests[start:start + BATCH_WRITE_SIZE]}
+            attempt = 0
+            while request_items:
+                response = self.manager.dynamodb_resource.batch_write_item(RequestItems=request_items)
+                request_items = response.get('UnprocessedItems') or {}
+                if request_items:
+                    attempt += 1
+                    if attempt > BATCH_MAX_RETRIES:
+                        raise RuntimeError("BatchWriteItem still throttled after retries")
+                    time.sleep(BATCH_BACKOFF_SECONDS * (2 ** attempt))
+    
+    def stop(self):
+        """Stop the background worker and flush whatever is left"""
+        self._stop.set()
+        self.flush()
+
+
 class DynamoDBManager:
     """Manages DynamoDB for Products, Orders, and Cart"""
     
@@ -31,6 +483,26 @@ class DynamoDBManager:
         """Initialize DynamoDB client and resource"""
         self.dynamodb_client = None
         self.dynamodb_resource = None
+        self._category_index_checked_at = None
+        self._category_index_ready = False
+        self.catalog_cache = CatalogCache(
+            ttl_seconds=Config.PRODUCT_CACHE_TTL,
+            max_entries=Config.PRODUCT_CACHE_MAX_ENTRIES
+        )
+        self.category_index = ProductCategoryIndex()
+        self._product_listeners = []
+        self.cart_buffer = None
+        if Config.CART_WRITE_BEHIND:
+            self.cart_buffer = CartWriteBuffer(
+                self,
+                max_entries=Config.CART_BUFFER_MAX_ENTRIES,
+                flush_interval=Config.CART_FLUSH_INTERVAL
+            )
+        self.inventory = ShardedInventory(
+            self,
+            cache_ttl=Config.INVENTORY_CACHE_TTL,
+            rebalance_interval=Config.INVENTORY_REBALANCE_INTERVAL
+        )
         self._initialize_dynamodb()
     
     def _initialize_dynamodb(self):
@@ -60,19 +532,39 @@ class DynamoDBManager:
             logger.error(f"Error initializing DynamoDB: {e}")
             raise
     
+    def add_product_listener(self, callback):
+        """Register callback(action, product) to run after create/update/delete of a product"""
+        self._product_listeners.append(callback)
+    
+    def _notify_product_change(self, action, product):
+        """Tell in-memory indexes about a product write; listener errors never fail the write"""
+        for callback in self._product_listeners:
+            try:
+                callback(action, product)
+            except Exception as e:
+                logger.warning(f"Product listener failed on {action} {product.get('product_id')}: {e}")
+    
     def create_tables_if_not_exist(self):
-        """Create DynamoDB tables for Products, Orders, and Cart"""
+        """Create DynamoDB tables for Products, Orders, Cart, Inventory, Idempotency, Analytics, Recommendations"""
         try:
             self._create_products_table()
             self._create_orders_table()
             self._create_cart_table()
+            self._create_inventory_table()
+            self._create_idempotency_table()
+            self._create_analytics_table()
+            self._create_recommendations_table()
+            self._ensure_ttl(Config.DYNAMODB_CART_TABLE)
+            self._ensure_ttl(Config.DYNAMODB_IDEMPOTENCY_TABLE)
+            self._ensure_ttl(Config.DYNAMODB_ANALYTICS_TABLE)
+            self._ensure_ttl(Config.DYNAMODB_RECOMMENDATIONS_TABLE)
             logger.info("All DynamoDB tables created/verified successfully")
         except Exception as e:
             logger.error(f"Error creating DynamoDB tables: {e}")
             raise
     
     def _create_products_table(self):
-        """Create Products table with sort key (NO GSI)"""
+        """Create Products table with sort key and a category GSI for per-category queries"""
         table_name = Config.DYNAMODB_PRODUCTS_TABLE
         
         try:
@@ -85,12 +577,22 @@ class DynamoDBManager:
                 TableName=table_name,
                 KeySchema=[
                     {'AttributeName': 'product_id', 'KeyType': 'HASH'},
-                    {'AttributeName': 'category', 'KeyType': 'RANGE'}  # Sort key instead of GSI
+                    {'AttributeName': 'category', 'KeyType': 'RANGE'}
                 ],
                 AttributeDefinitions=[
                     {'AttributeName': 'product_id', 'AttributeType': 'S'},
                     {'AttributeName': 'category', 'AttributeType': 'S'}
                 ],
+                GlobalSecondaryIndexes=[
+                    {
+                        'IndexName': Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX,
+                        'KeySchema': [
+                            {'AttributeName': 'category', 'KeyType': 'HASH'},
+                            {'AttributeName': 'product_id', 'KeyType': 'RANGE'}
+                        ],
+                        'Projection': {'ProjectionType': 'ALL'}
+                    }
+                ],
                 BillingMode='PAY_PER_REQUEST'
             )
             
@@ -103,6 +605,33 @@ class DynamoDBManager:
             else:
                 raise
     
+    def has_category_index(self):
+        """Check (and cache) whether the Products category GSI exists and is ACTIVE"""
+        now = time.monotonic()
+        if self._category_index_ready:
+            return True
+        if self._category_index_checked_at and now - self._category_index_checked_at < 300:
+            return False
+        
+        self._category_index_checked_at = now
+        try:
+            description = self.dynamodb_client.describe_table(
+                TableName=Config.DYNAMODB_PRODUCTS_TABLE
+            )['Table']
+            for index in description.get('GlobalSecondaryIndexes', []):
+                if (index['IndexName'] == Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX
+                        and index.get('IndexStatus') == 'ACTIVE'):
+                    self._category_index_ready = True
+        except ClientError as e:
+            logger.warning(f"Could not describe products table: {e}")
+        
+        if not self._category_index_ready:
+            logger.warning(
+                "Category index not available, falling back to Scan "
+                "(run migrate_category_index.py)"
+            )
+        return self._category_index_ready
+    
     def _create_orders_table(self):
         """Create Orders table with composite key (NO GSI)"""
         table_name = Config.DYNAMODB_ORDERS_TABLE
@@ -165,6 +694,148 @@ class DynamoDBManager:
             else:
                 raise
     
+    def _create_inventory_table(self):
+        """Create Inventory table (product_id + shard) for sharded stock counters"""
+        table_name = Config.DYNAMODB_INVENTORY_TABLE
+        
+        try:
+            existing_tables = self.dynamodb_client.list_tables()['TableNames']
+            if table_name in existing_tables:
+                logger.info(f"Table '{table_name}' already exists")
+                return
+            
+            table = self.dynamodb_resource.create_table(
+                TableName=table_name,
+                KeySchema=[
+                    {'AttributeName': 'product_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'shard', 'KeyType': 'RANGE'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'product_id', 'AttributeType': 'S'},
+                    {'AttributeName': 'shard', 'AttributeType': 'N'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            
+            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+            logger.info(f"Table '{table_name}' created successfully")
+            
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Table '{table_name}' already exists")
+            else:
+                raise
+    
+    def _create_idempotency_table(self):
+        """Create Idempotency table (simple key) holding replayable POST responses"""
+        table_name = Config.DYNAMODB_IDEMPOTENCY_TABLE
+        
+        try:
+            existing_tables = self.dynamodb_client.list_tables()['TableNames']
+            if table_name in existing_tables:
+                logger.info(f"Table '{table_name}' already exists")
+                return
+            
+            table = self.dynamodb_resource.create_table(
+                TableName=table_name,
+                KeySchema=[
+                    {'AttributeName': 'idempotency_key', 'KeyType': 'HASH'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'idempotency_key', 'AttributeType': 'S'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            
+            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+            logger.info(f"Table '{table_name}' created successfully")
+            
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Table '{table_name}' already exists")
+            else:
+                raise
+    
+    def _create_analytics_table(self):
+        """Create Analytics table (rollup + key) holding sales rollup counters"""
+        table_name = Config.DYNAMODB_ANALYTICS_TABLE
+        
+        try:
+            existing_tables = self.dynamodb_client.list_tables()['TableNames']
+            if table_name in existing_tables:
+                logger.info(f"Table '{table_name}' already exists")
+                return
+            
+            table = self.dynamodb_resource.create_table(
+                TableName=table_name,
+                KeySchema=[
+                    {'AttributeName': 'rollup', 'KeyType': 'HASH'},
+                    {'AttributeName': 'key', 'KeyType': 'RANGE'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'rollup', 'AttributeType': 'S'},
+                    {'AttributeName': 'key', 'AttributeType': 'S'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            
+            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+            logger.info(f"Table '{table_name}' created successfully")
+            
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Table '{table_name}' already exists")
+            else:
+                raise
+    
+    def _create_recommendations_table(self):
+        """Create Recommendations table (simple key) holding co-purchase neighbours per product"""
+        table_name = Config.DYNAMODB_RECOMMENDATIONS_TABLE
+        
+        try:
+            existing_tables = self.dynamodb_client.list_tables()['TableNames']
+            if table_name in existing_tables:
+                logger.info(f"Table '{table_name}' already exists")
+                return
+            
+            table = self.dynamodb_resource.create_table(
+                TableName=table_name,
+                KeySchema=[
+                    {'AttributeName': 'product_id', 'KeyType': 'HASH'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'product_id', 'AttributeType': 'S'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+            
+            table.meta.client.get_waiter('table_exists').wait(TableName=table_name)
+            logger.info(f"Table '{table_name}' created successfully")
+            
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceInUseException':
+                logger.info(f"Table '{table_name}' already exists")
+            else:
+                raise
+    
+    def _ensure_ttl(self, table_name):
+        """Enable DynamoDB TTL on <table>.expires_at (carts, idempotency keys, applied-order markers)"""
+        try:
+            description = self.dynamodb_client.describe_time_to_live(TableName=table_name)
+            status = description['TimeToLiveDescription'].get('TimeToLiveStatus')
+            if status in ('ENABLED', 'ENABLING'):
+                return
+            
+            self.dynamodb_client.update_time_to_live(
+                TableName=table_name,
+                TimeToLiveSpecification={'Enabled': True, 'AttributeName': 'expires_at'}
+            )
+            logger.info(f"TTL enabled on '{table_name}'.expires_at")
+            
+        except ClientError as e:
+            # DynamoDB Local and restricted IAM roles may not support TTL
+            logger.warning(f"Could not enable TTL on '{table_name}': {e}")
+    
     # PRODUCTS CRUD Operations
     
     def create_product(self, product_id, name, description, price, category, image_url='', stock=0):
@@ -187,47 +858,266 @@ class DynamoDBManager:
             logger.info(f"Product created: {product_id}")
             
             item['price'] = float(item['price'])
+            self.category_index.set(product_id, category)
+            self.catalog_cache.upsert(item)
+            self._notify_product_change('create', item)
             return item
             
         except Exception as e:
             logger.error(f"Error creating product: {e}")
             raise
     
-    def get_all_products(self, category=None):
-        """Get all products, optionally filtered by category"""
+    def get_all_products(self, category=None, fields=None):
+        """Get all products, optionally filtered by category (served from the catalog cache when fresh)"""
         try:
+            cached = self.catalog_cache.get(category)
+            if cached is not None:
+                return project(cached, fields, PRODUCT_KEY) if fields else cached
+            
             table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
             
+            # Fetch full items when they will be cached, so any fieldset can be served from memory
+            read_kwargs = {}
+            if fields and not self.catalog_cache.enabled:
+                read_kwargs['ProjectionExpression'], read_kwargs['ExpressionAttributeNames'] = \
+                    build_projection(fields, PRODUCT_KEY)
+            
             if category:
-                # Scan with filter (since we don't have GSI)
-                response = table.scan(
-                    FilterExpression=Attr('category').eq(category)
-                )
+                operation, read_kwargs = self._product_read(table, category, **read_kwargs)
+                items = [item for page in self.iter_pages(operation, **read_kwargs) for item in page]
             else:
-                response = table.scan()
+                items = list(self.parallel_scan(Config.DYNAMODB_PRODUCTS_TABLE, **read_kwargs))
+            
+            for item in items:
+                if 'price' in item:
+                    item['price'] = float(item['price'])
+            
+            self.category_index.update_from(items)
+            if 'ProjectionExpression' in read_kwargs:
+                return items
+            
+            self.catalog_cache.set(category, items)
+            return project(items, fields, PRODUCT_KEY) if fields else list(items)
+            
+        except Exception as e:
+            logger.error(f"Error getting products: {e}")
+            raise
+    
+    def get_products_page(self, category=None, limit=None, cursor=None, fields=None):
+        """Get one page of products; returns (items, next_cursor)"""
+        try:
+            table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
+            
+            operation, read_kwargs = self._product_read(
+                table, category, Limit=limit or Config.ITEMS_PER_PAGE
+            )
             
+            if fields:
+                read_kwargs['ProjectionExpression'], read_kwargs['ExpressionAttributeNames'] = \
+                    build_projection(fields, PRODUCT_KEY)
+            
+            start_key = decode_cursor(cursor)
+            if start_key:
+                read_kwargs['ExclusiveStartKey'] = start_key
+            
+            response = operation(**read_kwargs)
             items = response.get('Items', [])
             
             for item in items:
                 if 'price' in item:
                     item['price'] = float(item['price'])
             
-            return items
+            self.category_index.update_from(items)
+            return items, encode_cursor(response.get('LastEvaluatedKey'))
             
         except Exception as e:
-            logger.error(f"Error getting products: {e}")
+            logger.error(f"Error getting products page: {e}")
             raise
     
-    def get_product(self, product_id, category):
-        """Get a single product"""
+    def _product_read(self, table, category=None, **kwargs):
+        """Pick the read for a product listing: Query on the category GSI, or Scan for everything"""
+        if category and self.has_category_index():
+            kwargs['IndexName'] = Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX
+            kwargs['KeyConditionExpression'] = Key('category').eq(category)
+            return table.query, kwargs
+        
+        if category:
+            # Index still missing or backfilling: filter a full scan
+            kwargs['FilterExpression'] = Attr('category').eq(category)
+        return table.scan, kwargs
+    
+    def parallel_scan(self, table_name, total_segments=None, **scan_kwargs):
+        """
+        Scan a whole table with Segment/TotalSegments across a thread pool.
+        Yields deserialized items as segments return pages, in no particular order.
+        scan_kwargs are low-level client arguments (e.g. ProjectionExpression strings).
+        """
+        segments = max(1, total_segments or Config.DYNAMODB_SCAN_SEGMENTS)
+        deserializer = TypeDeserializer()
+        results = queue.Queue(maxsize=segments * 2)
+        stop = threading.Event()
+        done = object()
+        
+        def put(result):
+            # Bounded hand-off so a slow consumer throttles the scanners
+            while not stop.is_set():
+                try:
+                    results.put(result, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def scan_segment(segment):
+            kwargs = dict(scan_kwargs, TableName=table_name, Segment=segment, TotalSegments=segments)
+            try:
+                while not stop.is_set():
+                    # boto3 clients are thread-safe; resources are not
+                    response = self.dynamodb_client.scan(**kwargs)
+                    items = [
+                        {k: deserializer.deserialize(v) for k, v in item.items()}
+                        for item in response.get('Items', [])
+                    ]
+                    if not put(items):
+                        return
+                    
+                    last_key = response.get('LastEvaluatedKey')
+                    if not last_key:
+                        break
+                    kwargs['ExclusiveStartKey'] = last_key
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+        
+        with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='dynamodb-scan') as executor:
+            for segment in range(segments):
+                executor.submit(scan_segment, segment)
+            
+            try:
+                finished = 0
+                while finished < segments:
+                    result = results.get()
+                    if result is done:
+                        finished += 1
+                    elif isinstance(result, Exception):
+                        raise result
+                    else:
+                        yield from result
+            finally:
+                stop.set()
+    
+    def iter_pages(self, operation, **kwargs):
+        """Yield each page of a scan/query, following LastEvaluatedKey until exhausted"""
+        while True:
+            response = operation(**kwargs)
+            yield response.get('Items', [])
+            
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                break
+            kwargs['ExclusiveStartKey'] = last_key
+    
+    def resolve_category(self, product_id):
+        """Resolve a product's category (sort key) from memory, else with a key-only Query"""
+        category = self.category_index.get(product_id)
+        if category:
+            return category
+        
+        table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
+        response = table.query(
+            KeyConditionExpression=Key('product_id').eq(product_id),
+            ProjectionExpression='category',
+            Limit=1
+        )
+        
+        items = response.get('Items', [])
+        if not items:
+            return None
+        
+        category = items[0]['category']
+        self.category_index.set(product_id, category)
+        return category
+    
+    def resolve_categories(self, product_ids):
+        """
+        Resolve many categories: from memory, else with concurrent key-only Queries, or
+        for many unknown ids by loading the (cached) catalog listing once. Returns
+        {product_id: category} for the products that exist.
+        """
+        categories = {}
+        unknown = []
+        for product_id in dict.fromkeys(product_ids):
+            category = self.category_index.get(product_id)
+            if category:
+                categories[product_id] = category
+            elif not self.category_index.is_missing(product_id):
+                unknown.append(product_id)
+        
+        if len(unknown) > CATEGORY_QUERY_LIMIT and self.catalog_cache.enabled:
+            # One cached listing read (shared with /api/products) beats a Query per id
+            self.get_all_products()
+            found = [(product_id, self.category_index.get(product_id)) for product_id in unknown]
+        elif unknown:
+            with ThreadPoolExecutor(max_workers=min(len(unknown), CATEGORY_LOOKUP_WORKERS)) as pool:
+                found = list(zip(unknown, pool.map(self._query_category, unknown)))
+        else:
+            found = []
+        
+        for product_id, category in found:
+            if category:
+                self.category_index.set(product_id, category)
+                categories[product_id] = category
+            else:
+                self.category_index.mark_missing(product_id)
+        return categories
+    
+    def _query_category(self, product_id):
+        """Key-only Query on the low-level client (thread-safe, unlike the resource API)"""
+        response = self.dynamodb_client.query(
+            TableName=Config.DYNAMODB_PRODUCTS_TABLE,
+            KeyConditionExpression='product_id = :product_id',
+            ExpressionAttributeValues={':product_id': {'S': product_id}},
+            ProjectionExpression='category',
+            Limit=1
+        )
+        items = response.get('Items', [])
+        return items[0]['category']['S'] if items else None
+    
+    def get_product(self, product_id, category=None, fields=None):
+        """Get a single product (one GetItem, or one Query on product_id when category is unknown)"""
         try:
             table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
-            response = table.get_item(Key={
-                'product_id': product_id,
-                'category': category
-            })
             
-            item = response.get('Item')
+            read_kwargs = {}
+            if fields:
+                read_kwargs['ProjectionExpression'], read_kwargs['ExpressionAttributeNames'] = \
+                    build_projection(fields, PRODUCT_KEY)
+            
+            if category is None:
+                category = self.category_index.get(product_id)
+            
+            if category is None:
+                # product_id is the partition key, so this reads at most one partition
+                response = table.query(
+                    KeyConditionExpression=Key('product_id').eq(product_id),
+                    Limit=1,
+                    **read_kwargs
+                )
+                items = response.get('Items', [])
+                item = items[0] if items else None
+            else:
+                response = table.get_item(
+                    Key={'product_id': product_id, 'category': category},
+                    **read_kwargs
+                )
+                item = response.get('Item')
+            
+            if item:
+                self.category_index.set(product_id, item['category'])
+            else:
+                self.category_index.discard(product_id)
+            
             if item and 'price' in item:
                 item['price'] = float(item['price'])
             
@@ -237,11 +1127,75 @@ class DynamoDBManager:
             logger.error(f"Error getting product: {e}")
             raise
     
-    def update_product(self, product_id, category, **kwargs):
-        """Update a product"""
+    def get_products_batch(self, product_ids, fields=None):
+        """Get many products with BatchGetItem; returns (items in request order, missing ids)"""
+        try:
+            product_ids = list(dict.fromkeys(product_ids))
+            categories = self.resolve_categories(product_ids)
+            
+            keys = []
+            missing = []
+            for product_id in product_ids:
+                category = categories.get(product_id)
+                if category:
+                    keys.append({'product_id': product_id, 'category': category})
+                else:
+                    missing.append(product_id)
+            
+            request_options = {}
+            if fields:
+                request_options['ProjectionExpression'], request_options['ExpressionAttributeNames'] = \
+                    build_projection(fields, PRODUCT_KEY)
+            
+            table_name = Config.DYNAMODB_PRODUCTS_TABLE
+            found = {}
+            for start in range(0, len(keys), BATCH_GET_SIZE):
+                request_items = {table_name: dict(request_options, Keys=keys[start:start + BATCH_GET_SIZE])}
+                
+                attempt = 0
+                while request_items:
+                    response = self.dynamodb_resource.batch_get_item(RequestItems=request_items)
+                    for item in response.get('Responses', {}).get(table_name, []):
+                        found[item['product_id']] = item
+                    
+                    request_items = response.get('UnprocessedKeys') or {}
+                    if request_items:
+                        attempt += 1
+                        if attempt > BATCH_MAX_RETRIES:
+                            raise RuntimeError("BatchGetItem still throttled after retries")
+                        time.sleep(BATCH_BACKOFF_SECONDS * (2 ** attempt))
+            
+            items = []
+            for product_id in product_ids:
+                item = found.get(product_id)
+                if item is None:
+                    if product_id not in missing:
+                        self.category_index.discard(product_id)
+                        missing.append(product_id)
+                    continue
+                if 'price' in item:
+                    item['price'] = float(item['price'])
+                items.append(item)
+            
+            return items, missing
+            
+        except Exception as e:
+            logger.error(f"Error batch getting products: {e}")
+            raise
+    
+    def update_product(self, product_id, category=None, **kwargs):
+        """Update an existing product; returns None if it does not exist"""
         try:
             table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
             
+            category = category or self.resolve_category(product_id)
+            if not category:
+                return None
+            
+            if kwargs.get('stock') is not None and self.inventory.shard_count(product_id, exact=True):
+                # Restocks go to the shards; Products.stock is only their display total
+                self.inventory.set_stock(product_id, kwargs['stock'])
+            
             update_expr = []
             expr_attr_values = {}
             expr_attr_names = {}
@@ -262,18 +1216,34 @@ class DynamoDBManager:
             if not update_expr:
                 raise ValueError("No fields to update")
             
-            response = table.update_item(
-                Key={'product_id': product_id, 'category': category},
-                UpdateExpression="SET " + ", ".join(update_expr),
-                ExpressionAttributeValues=expr_attr_values,
-                ExpressionAttributeNames=expr_attr_names if expr_attr_names else None,
-                ReturnValues="ALL_NEW"
-            )
+            # Never let a stale category upsert a second copy of the product
+            expr_attr_names['#pid'] = 'product_id'
+            
+            try:
+                response = table.update_item(
+                    Key={'product_id': product_id, 'category': category},
+                    UpdateExpression="SET " + ", ".join(update_expr),
+                    ConditionExpression="attribute_exists(#pid)",
+                    ExpressionAttributeValues=expr_attr_values,
+                    ExpressionAttributeNames=expr_attr_names,
+                    ReturnValues="ALL_NEW"
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    self.category_index.discard(product_id)
+                    return None
+                raise
             
             item = response.get('Attributes')
             if item and 'price' in item:
                 item['price'] = float(item['price'])
             
+            if item:
+                self.catalog_cache.upsert(item)
+                self._notify_product_change('update', item)
+            else:
+                self.catalog_cache.invalidate()
+            
             logger.info(f"Product updated: {product_id}")
             return item
             
@@ -281,17 +1251,28 @@ class DynamoDBManager:
             logger.error(f"Error updating product: {e}")
             raise
     
-    def delete_product(self, product_id, category):
+    def delete_product(self, product_id, category=None):
         """Delete a product"""
         try:
             table = self.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
+            
+            category = category or self.resolve_category(product_id)
+            if not category:
+                return False
+            
+            if self.inventory.shard_count(product_id, exact=True):
+                self.inventory.disable(product_id)
+            
             response = table.delete_item(
                 Key={'product_id': product_id, 'category': category},
                 ReturnValues='ALL_OLD'
             )
             
             deleted = 'Attributes' in response
+            self.category_index.discard(product_id)
             if deleted:
+                self.catalog_cache.remove(product_id)
+                self._notify_product_change('delete', response['Attributes'])
                 logger.info(f"Product deleted: {product_id}")
             
             return deleted
@@ -311,6 +1292,7 @@ class DynamoDBManager:
                 'user_id': user_id,  # Partition key
                 'order_id': order_id,  # Sort key
                 'items': items,
+                'item_count': order_item_count(items),
                 'total_amount': Decimal(str(total_amount)),
                 'shipping_address': shipping_address,
                 'status': status,
@@ -327,27 +1309,244 @@ class DynamoDBManager:
             logger.error(f"Error creating order: {e}")
             raise
     
-    def get_user_orders(self, user_id):
-        """Get all orders for a user using partition key"""
+    def checkout(self, order_id, user_id, items, total_amount, shipping_address, status='pending'):
+        """
+        Place an order in one TransactWriteItems call: put the order, decrement each
+        product's stock (never below zero) and delete the cart, all or nothing.
+        Sharded products take their units from one random inventory shard, or split
+        them over several shards when no single shard holds the quantity; a dry shard
+        or a write conflict retries the transaction with freshly read shard counts.
+        Raises OutOfStockError naming the lines that could not be reserved.
+        """
         try:
-            table = self.dynamodb_resource.Table(Config.DYNAMODB_ORDERS_TABLE)
-            response = table.query(
-                KeyConditionExpression=Key('user_id').eq(user_id),
-                ScanIndexForward=False  # Most recent first
-            )
+            quantities = OrderedDict()
+            for line in items:
+                product_id = line.get('product_id')
+                quantity = int(line.get('quantity', 1))
+                if not product_id or quantity < 1:
+                    raise ValueError("Each item needs a product_id and a positive quantity")
+                quantities[product_id] = quantities.get(product_id, 0) + quantity
             
-            items = response.get('Items', [])
+            if not quantities:
+                raise ValueError("Order has no items")
+            if len(quantities) > TRANSACT_MAX_ITEMS - 2:
+                raise ValueError(f"An order can contain at most {TRANSACT_MAX_ITEMS - 2} different products")
             
-            for item in items:
-                if 'total_amount' in item:
-                    item['total_amount'] = float(item['total_amount'])
+            categories = {product_id: self.resolve_category(product_id) for product_id in quantities}
+            unknown = [product_id for product_id, category in categories.items() if not category]
+            if unknown:
+                raise ValueError(f"Unknown products: {', '.join(unknown)}")
+            
+            order = {
+                'user_id': user_id,
+                'order_id': order_id,
+                'items': to_dynamo(items),
+                'item_count': sum(quantities.values()),
+                'total_amount': Decimal(str(total_amount)),
+                'shipping_address': to_dynamo(shipping_address),
+                'status': status,
+                'created_at': datetime.now().isoformat()
+            }
+            
+            serializer = TypeSerializer()
+            serialize = lambda value: {k: serializer.serialize(v) for k, v in value.items()}
+            
+            if self.cart_buffer:
+                # A buffered or in-flight save landing after the transaction would resurrect the cart
+                self.cart_buffer.discard(user_id)
+            
+            names = {line.get('product_id'): line.get('name') for line in items}
+            
+            def out_of_stock(product_ids):
+                return OutOfStockError([
+                    {'product_id': product_id, 'name': names.get(product_id), 'requested': quantities[product_id]}
+                    for product_id in product_ids
+                ])
+            
+            stale_shards = set()  # sharded products whose counts must be re-read before planning
+            for attempt in range(CHECKOUT_ATTEMPTS):
+                plans = {}
+                owners = [None]  # product_id behind each action, to map cancellation reasons back
+                actions = [{
+                    'Put': {
+                        'TableName': Config.DYNAMODB_ORDERS_TABLE,
+                        'Item': serialize(order),
+                        'ConditionExpression': 'attribute_not_exists(order_id)'
+                    }
+                }]
+                for product_id, quantity in quantities.items():
+                    plan = None
+                    if self.inventory.shard_count(product_id):
+                        # Hot product: take the units from one shard, or split them over several
+                        plan = self.inventory.plan_decrement(product_id, quantity, fresh=product_id in stale_shards)
+                        if plan is None and product_id not in stale_shards:
+                            plan = self.inventory.plan_decrement(product_id, quantity, fresh=True)
+                        # No shards left at all means another process unsharded it: use Products
+                        if plan is None and self.inventory.shard_count(product_id, exact=True):
+                            raise out_of_stock([product_id])
+                    if plan:
+                        plans[product_id] = plan
+                        for shard, units in plan.items():
+                            actions.append(self.inventory.decrement_action(product_id, shard, units))
+                            owners.append(product_id)
+                        continue
+                    
+                    owners.append(product_id)
+                    actions.append({
+                        'Update': {
+                            'TableName': Config.DYNAMODB_PRODUCTS_TABLE,
+                            'Key': serialize({'product_id': product_id, 'category': categories[product_id]}),
+                            'UpdateExpression': 'SET #stock = #stock - :qty',
+                            'ConditionExpression': '#stock >= :qty AND attribute_not_exists(#shards)',
+                            'ExpressionAttributeNames': {'#stock': 'stock', '#shards': 'stock_shards'},
+                            'ExpressionAttributeValues': {':qty': {'N': str(quantity)}},
+                            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+                        }
+                    })
+                actions.append({
+                    'Delete': {
+                        'TableName': Config.DYNAMODB_CART_TABLE,
+                        'Key': serialize({'user_id': user_id})
+                    }
+                })
+                if len(actions) > TRANSACT_MAX_ITEMS:
+                    raise ValueError("Order needs too many stock shards at once; please split it")
+                
+                try:
+                    self.dynamodb_client.transact_write_items(TransactItems=actions)
+                    break
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'TransactionCanceledException':
+                        raise
+                    
+                    cancelled = e
+                    reasons = e.response.get('CancellationReasons', [])
+                    if reasons and reasons[0].get('Code') == 'ConditionalCheckFailed':
+                        raise ValueError(f"Order {order_id} already exists")
+                
+                failed = []
+                retry = False
+                for index, product_id in enumerate(owners):
+                    reason = reasons[index] if index < len(reasons) else {}
+                    code = reason.get('Code')
+                    old = reason.get('Item') or {}
+                    
+                    if product_id is None or product_id in failed:
+                        continue
+                    if code in CHECKOUT_RETRY_REASONS:
+                        retry = True
+                    elif code != 'ConditionalCheckFailed':
+                        continue
+                    elif product_id in plans:
+                        if 'stock' not in old:
+                            # Shard is gone: the product was unsharded by another process
+                            self.inventory.refresh_product(product_id)
+                            retry = True
+                        elif self.inventory.get_stock(product_id, refresh=True) >= quantities[product_id]:
+                            # A shard ran dry, the shards together still hold enough: re-plan
+                            stale_shards.add(product_id)
+                            retry = True
+                        else:
+                            failed.append(product_id)
+                    elif 'stock_shards' in old:
+                        # Sharded by another process since our registry was loaded
+                        self.inventory.refresh_product(product_id)
+                        retry = True
+                    else:
+                        failed.append(product_id)
+                
+                if failed:
+                    raise out_of_stock(failed)
+                if not retry:
+                    raise cancelled
+                if attempt == CHECKOUT_ATTEMPTS - 1:
+                    raise RuntimeError("Stock is busy, please retry the order")
+                time.sleep(random.uniform(0, BATCH_BACKOFF_SECONDS * (2 ** attempt)))
+            
+            for product_id, plan in plans.items():
+                for shard, units in plan.items():
+                    self.inventory.note_decrement(product_id, shard, units)
+            for product_id, quantity in quantities.items():
+                self.catalog_cache.adjust_stock(product_id, -quantity)
+            
+            logger.info(f"Order placed: {order_id} ({len(quantities)} products)")
             
-            return items
+            order['items'] = items
+            order['total_amount'] = float(order['total_amount'])
+            order['shipping_address'] = shipping_address
+            return order
+            
+        except Exception as e:
+            logger.error(f"Error during checkout: {e}")
+            raise
+    
+    def _user_orders_query(self, user_id, fields=None, since=None, until=None):
+        """Query kwargs for a user's orders, newest first; order IDs sort by time, so
+        since/until (datetimes; until exclusive) become a key range"""
+        key_condition = Key('user_id').eq(user_id)
+        if since is not None and until is not None:
+            if since >= until:
+                raise ValueError("since must be before until")
+            key_condition &= Key('order_id').between(
+                order_id_bound(since),
+                order_id_bound(until - timedelta(milliseconds=1), upper=True)
+            )
+        elif since is not None:
+            key_condition &= Key('order_id').gte(order_id_bound(since))
+        elif until is not None:
+            key_condition &= Key('order_id').lt(order_id_bound(until))
+        
+        read_kwargs = {
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': False  # Most recent first
+        }
+        if fields:
+            read_kwargs['ProjectionExpression'], read_kwargs['ExpressionAttributeNames'] = \
+                build_projection(fields, ORDER_KEY)
+        return read_kwargs
+    
+    def get_user_orders(self, user_id, fields=None, limit=None, since=None, until=None):
+        """Get a user's orders, most recent first (all pages unless limit is given)"""
+        try:
+            table = self.dynamodb_resource.Table(Config.DYNAMODB_ORDERS_TABLE)
+            read_kwargs = self._user_orders_query(user_id, fields, since, until)
+            
+            items = []
+            if limit:
+                items = table.query(Limit=limit, **read_kwargs).get('Items', [])
+            else:
+                for page in self.iter_pages(table.query, **read_kwargs):
+                    items.extend(page)
+            
+            return [order_from_dynamo(item) for item in items]
             
         except Exception as e:
             logger.error(f"Error getting user orders: {e}")
             raise
     
+    def get_user_orders_page(self, user_id, limit=None, cursor=None, fields=ORDER_SUMMARY_FIELDS,
+                             since=None, until=None):
+        """Get one page of a user's orders (summaries by default); returns (items, next_cursor)"""
+        try:
+            table = self.dynamodb_resource.Table(Config.DYNAMODB_ORDERS_TABLE)
+            read_kwargs = self._user_orders_query(user_id, fields, since, until)
+            read_kwargs['Limit'] = limit or Config.ITEMS_PER_PAGE
+            
+            start_key = decode_cursor(cursor)
+            if start_key:
+                if start_key.get('user_id') != user_id:
+                    raise ValueError("Invalid cursor")
+                read_kwargs['ExclusiveStartKey'] = start_key
+            
+            response = table.query(**read_kwargs)
+            items = [order_from_dynamo(item) for item in response.get('Items', [])]
+            
+            return items, encode_cursor(response.get('LastEvaluatedKey'))
+            
+        except Exception as e:
+            logger.error(f"Error getting user orders page: {e}")
+            raise
+    
     def get_order(self, user_id, order_id):
         """Get a specific order"""
         try:
@@ -357,51 +1556,250 @@ class DynamoDBManager:
                 'order_id': order_id
             })
             
-            item = response.get('Item')
-            if item and 'total_amount' in item:
-                item['total_amount'] = float(item['total_amount'])
+            return order_from_dynamo(response.get('Item'))
+            
+        except Exception as e:
+            logger.error(f"Error getting order: {e}")
+            raise
+    
+    def update_order_status(self, user_id, order_id, status, expected_status=None):
+        """
+        Set an order's status; with expected_status the change only applies from that
+        status (so replayed pipeline steps cannot move an order backwards).
+        Returns the updated order, or None if the order or expected status did not match.
+        """
+        try:
+            table = self.dynamodb_resource.Table(Config.DYNAMODB_ORDERS_TABLE)
+            
+            condition = 'attribute_exists(#oid)'
+            values = {':status': status, ':now': datetime.now().isoformat()}
+            if expected_status is not None:
+                condition += ' AND #status = :expected'
+                values[':expected'] = expected_status
             
+            try:
+                response = table.update_item(
+                    Key={'user_id': user_id, 'order_id': order_id},
+                    UpdateExpression='SET #status = :status, updated_at = :now',
+                    ConditionExpression=condition,
+                    ExpressionAttributeNames={'#status': 'status', '#oid': 'order_id'},
+                    ExpressionAttributeValues=values,
+                    ReturnValues='ALL_NEW'
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                    return None
+                raise
+            
+            item = order_from_dynamo(response.get('Attributes'))
+            
+            logger.info(f"Order {order_id} status: {expected_status or '*'} -> {status}")
             return item
             
         except Exception as e:
-            logger.error(f"Error getting order: {e}")
+            logger.error(f"Error updating order status: {e}")
             raise
     
     # CART Operations
     
     def save_cart(self, user_id, items):
-        """Save or update cart"""
+        """Save or replace the whole cart (items are stored as a map keyed by product_id)"""
         try:
             table = self.dynamodb_resource.Table(Config.DYNAMODB_CART_TABLE)
             
             item = {
                 'user_id': user_id,
-                'items': items,
-                'updated_at': datetime.now().isoformat()
+                'items': cart_items_to_map(items),
+                'updated_at': datetime.now().isoformat(),
+                'expires_at': cart_expires_at()
             }
             
+            if self.cart_buffer:
+                self.cart_buffer.put(user_id, item)
+                return self._hydrate_cart(cart_from_dynamo(item))
+            
             table.put_item(Item=item)
             logger.info(f"Cart saved for user: {user_id}")
-            return item
+            return self._hydrate_cart(cart_from_dynamo(item))
             
         except Exception as e:
             logger.error(f"Error saving cart: {e}")
             raise
     
     def get_cart(self, user_id):
-        """Get user's cart"""
+        """Get user's cart (buffered saves are read back before DynamoDB)"""
         try:
+            if self.cart_buffer:
+                found, item = self.cart_buffer.get(user_id)
+                if found:
+                    return self._hydrate_cart(cart_from_dynamo(item))
+            
             table = self.dynamodb_resource.Table(Config.DYNAMODB_CART_TABLE)
             response = table.get_item(Key={'user_id': user_id})
-            return response.get('Item')
+            return self._hydrate_cart(cart_from_dynamo(response.get('Item')))
             
         except Exception as e:
             logger.error(f"Error getting cart: {e}")
             raise
     
+    def update_cart_item(self, user_id, product_id, op, quantity=1, details=None):
+        """
+        Change one cart line with an UpdateExpression instead of rewriting the cart.
+        op: 'add' (quantity += n), 'set' (quantity = n) or 'remove'.
+        details['price'] is recorded when the line is new; display fields come from the catalog.
+        """
+        if op not in CART_OPS:
+            raise ValueError(f"op must be one of: {', '.join(CART_OPS)}")
+        
+        try:
+            if self.cart_buffer:
+                # Deltas apply on top of the latest full save
+                self.cart_buffer.flush([user_id])
+            
+            if op == 'remove' or (op == 'set' and quantity <= 0):
+                return self._update_cart(
+                    user_id,
+                    "REMOVE #items.#pid SET updated_at = :now, expires_at = :exp",
+                    {'#pid': product_id}
+                )
+            
+            if op == 'add':
+                existing_expr = "SET #items.#pid.#qty = #items.#pid.#qty + :qty, updated_at = :now, expires_at = :exp"
+            else:
+                existing_expr = "SET #items.#pid.#qty = :qty, updated_at = :now, expires_at = :exp"
+            line = to_dynamo(compact_cart_line(dict(details or {}, quantity=quantity)))
+            
+            cart = None
+            for _ in range(CART_UPDATE_RETRIES):
+                try:
+                    # Line already in the cart: touch only its quantity
+                    cart = self._update_cart(
+                        user_id, existing_expr,
+                        {'#pid': product_id, '#qty': 'quantity'},
+                        {':qty': quantity},
+                        condition="attribute_exists(#items.#pid)"
+                    )
+                    break
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                
+                try:
+                    # New line; a concurrent tab adding it first sends us back round the loop
+                    cart = self._update_cart(
+                        user_id, "SET #items.#pid = :line, updated_at = :now, expires_at = :exp",
+                        {'#pid': product_id},
+                        {':line': line},
+                        condition="attribute_not_exists(#items.#pid)"
+                    )
+                    break
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+            
+            if cart is None:
+                raise RuntimeError("Cart changed concurrently, please retry")
+            
+            if op == 'add':
+                current = next((i for i in cart['items'] if i['product_id'] == product_id), None)
+                if current and current.get('quantity', 0) <= 0:
+                    return self.update_cart_item(user_id, product_id, 'remove')
+            
+            logger.info(f"Cart item {op} for user {user_id}: {product_id}")
+            return cart
+            
+        except Exception as e:
+            logger.error(f"Error updating cart item: {e}")
+            raise
+    
+    def _update_cart(self, user_id, update_expression, names, values=None, condition=None):
+        """Run one cart UpdateExpression, creating/upgrading the items map when it is missing"""
+        table = self.dynamodb_resource.Table(Config.DYNAMODB_CART_TABLE)
+        
+        kwargs = {
+            'Key': {'user_id': user_id},
+            'UpdateExpression': update_expression,
+            'ExpressionAttributeNames': dict(names, **{'#items': 'items'}),
+            'ExpressionAttributeValues': dict(values or {}, **{
+                ':now': datetime.now().isoformat(),
+                ':exp': cart_expires_at()
+            }),
+            'ReturnValues': 'ALL_NEW'
+        }
+        if condition:
+            kwargs['ConditionExpression'] = condition
+        
+        try:
+            response = table.update_item(**kwargs)
+        except ClientError as e:
+            # Nested paths fail when the cart (or its items map) does not exist yet
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            self._ensure_cart_map(user_id)
+            response = table.update_item(**kwargs)
+        
+        return self._hydrate_cart(cart_from_dynamo(response.get('Attributes')))
+    
+    def _hydrate_cart(self, cart):
+        """Fill display fields of compact cart lines from the catalog cache, else one BatchGetItem"""
+        if not cart or not cart['items']:
+            return cart
+        
+        products = {}
+        missing = []
+        for line in cart['items']:
+            product = self.catalog_cache.find(line['product_id'])
+            if product:
+                products[line['product_id']] = product
+            else:
+                missing.append(line['product_id'])
+        
+        if missing:
+            try:
+                fetched, _ = self.get_products_batch(missing, fields=CART_DISPLAY_FIELDS + ('price',))
+                products.update((p['product_id'], p) for p in fetched)
+            except Exception as e:
+                logger.warning(f"Could not hydrate cart lines: {e}")
+        
+        for line in cart['items']:
+            product = products.get(line['product_id'])
+            if not product:
+                continue
+            for field in CART_DISPLAY_FIELDS:
+                if field in product:
+                    line[field] = _from_dynamo_number(product[field])
+            line.setdefault('price', product.get('price'))
+            line['current_price'] = product.get('price')
+        
+        return cart
+    
+    def _ensure_cart_map(self, user_id):
+        """Make sure the cart item exists with items stored as a map"""
+        table = self.dynamodb_resource.Table(Config.DYNAMODB_CART_TABLE)
+        current = table.get_item(Key={'user_id': user_id}, ConsistentRead=True).get('Item')
+        
+        if current and isinstance(current.get('items'), list):
+            # Upgrade a legacy list cart, unless it changed since we read it
+            table.put_item(
+                Item=dict(current, items=cart_items_to_map(current['items'])),
+                ConditionExpression="updated_at = :seen",
+                ExpressionAttributeValues={':seen': current.get('updated_at')}
+            )
+        elif not current or 'items' not in current:
+            table.update_item(
+                Key={'user_id': user_id},
+                UpdateExpression="SET #items = if_not_exists(#items, :empty)",
+                ExpressionAttributeNames={'#items': 'items'},
+                ExpressionAttributeValues={':empty': {}}
+            )
+    
     def clear_cart(self, user_id):
         """Clear user's cart"""
         try:
+            if self.cart_buffer:
+                self.cart_buffer.put(user_id, None)
+                return True
+            
             table = self.dynamodb_resource.Table(Config.DYNAMODB_CART_TABLE)
             table.delete_item(Key={'user_id': user_id})
             logger.info(f"Cart cleared for user: {user_id}")
@@ -1,12 +1,16 @@
 """
 AWS RDS PostgreSQL utilities for User Management
 Handles user authentication and profile data
-Uses psycopg v3 (native API)
+Uses psycopg v3 (native API) with a psycopg_pool connection pool
 """
 import psycopg
+from psycopg.pq import TransactionStatus
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool, PoolTimeout
 from config import Config
+import atexit
 import logging
+import threading
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -16,7 +20,7 @@ class RDSManager:
     """Manages RDS PostgreSQL connections for Users"""
     
     def __init__(self):
-        """Initialize connection parameters"""
+        """Initialize connection parameters; the pool opens on first use"""
         self.conninfo = (
             f"host={Config.RDS_HOST} "
             f"port={Config.RDS_PORT} "
@@ -24,23 +28,66 @@ class RDSManager:
             f"user={Config.RDS_USERNAME} "
             f"password={Config.RDS_PASSWORD}"
         )
-        logger.info("RDS connection pool created successfully")
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        atexit.register(self.close_all_connections)  # no-op unless a pool was opened
+    
+    def _get_pool(self):
+        """Open the pool lazily, so importing this module never touches the network"""
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    pool = ConnectionPool(
+                        self.conninfo,
+                        min_size=Config.RDS_POOL_MIN_SIZE,
+                        max_size=Config.RDS_POOL_MAX_SIZE,
+                        max_lifetime=Config.RDS_POOL_MAX_LIFETIME,
+                        max_idle=Config.RDS_POOL_MAX_IDLE,
+                        timeout=Config.RDS_POOL_TIMEOUT,
+                        check=ConnectionPool.check_connection,  # health check on checkout
+                        name='rds',
+                        open=False
+                    )
+                    # Minimum connections are filled in the background
+                    pool.open(wait=False)
+                    self._pool = pool
+                    logger.info(
+                        f"RDS connection pool created successfully "
+                        f"(min {Config.RDS_POOL_MIN_SIZE}, max {Config.RDS_POOL_MAX_SIZE})"
+                    )
+        return self._pool
     
     def get_connection(self):
-        """Get a new connection"""
+        """Borrow a connection from the pool (waits up to RDS_POOL_TIMEOUT seconds)"""
         try:
-            return psycopg.connect(self.conninfo)
+            return self._get_pool().getconn()
+        except PoolTimeout as e:
+            logger.error(f"Timed out waiting for an RDS connection: {e}")
+            raise
         except Exception as e:
             logger.error(f"Error getting connection: {e}")
             raise
     
     def return_connection(self, conn):
-        """Close a connection (replaces pool return)"""
+        """Give a connection back to the pool"""
+        try:
+            if conn.info.transaction_status == TransactionStatus.INTRANS:
+                # Read-only queries leave a transaction open; end it before reuse
+                conn.rollback()
+        except Exception as e:
+            logger.error(f"Error resetting connection: {e}")
+        
         try:
-            if conn and not conn.closed:
-                conn.close()
+            pool = self._pool
+            if pool is not None:
+                pool.putconn(conn)
+                return
         except Exception as e:
-            logger.error(f"Error closing connection: {e}")
+            # e.g. the connection came from a pool that close_all_connections() drained
+            logger.error(f"Error returning connection: {e}")
+        
+        if not conn.closed:
+            conn.close()
     
     def create_tables_if_not_exist(self):
         """Create users table in RDS if it doesn't exist"""
@@ -211,8 +258,17 @@ class RDSManager:
                 self.return_connection(conn)
 
     def close_all_connections(self):
-        """Close all connections"""
-        logger.info("All RDS connections closed")
+        """Drain the pool and close all connections (the next query opens a new pool)"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        
+        if pool is not None:
+            pool.close(timeout=Config.RDS_POOL_TIMEOUT)
+            logger.info("All RDS connections closed")
+    
+    def pool_stats(self):
+        """Pool counters (size, available, waiting, ...) for monitoring"""
+        return self._pool.get_stats() if self._pool is not None else {}
 
 
 # Singleton instance
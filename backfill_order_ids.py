@@ -0,0 +1,125 @@
+"""
+Re-key legacy orders (ORD-<random hex>) with time-ordered IDs, and add item_count
+The new ID encodes the order's created_at, so existing orders join the chronological
+sort key. Each order is moved with one transaction (put new key + delete old key);
+the old ID is kept in legacy_order_id. Run while the order workers are idle.
+Run: python backfill_order_ids.py [--dry-run]
+"""
+from config import Config
+from aws_dynamodb import dynamodb_manager, order_item_count
+from order_ids import new_order_id, is_time_ordered
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from datetime import datetime
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+serializer = TypeSerializer()
+
+
+def serialize(value):
+    return {k: serializer.serialize(v) for k, v in value.items()}
+
+
+def orders_to_backfill():
+    """Stream orders with a legacy ID or without item_count"""
+    for order in dynamodb_manager.parallel_scan(Config.DYNAMODB_ORDERS_TABLE):
+        if not is_time_ordered(order['order_id']) or 'item_count' not in order:
+            yield order
+
+
+def add_item_count(order):
+    """Store item_count on an order that already has a time-ordered ID"""
+    table = dynamodb_manager.dynamodb_resource.Table(Config.DYNAMODB_ORDERS_TABLE)
+    table.update_item(
+        Key={'user_id': order['user_id'], 'order_id': order['order_id']},
+        UpdateExpression='SET item_count = :count',
+        ConditionExpression='attribute_exists(order_id)',
+        ExpressionAttributeValues={':count': order_item_count(order.get('items'))}
+    )
+
+
+def rekey_order(order):
+    """Move one order to a time-ordered ID; returns the new ID"""
+    created_at = order.get('created_at')
+    moment = datetime.fromisoformat(created_at) if created_at else datetime.now()
+    new_id = new_order_id(moment)
+
+    new_item = dict(
+        order,
+        order_id=new_id,
+        legacy_order_id=order['order_id'],
+        item_count=order_item_count(order.get('items'))
+    )
+    dynamodb_manager.dynamodb_client.transact_write_items(TransactItems=[
+        {
+            'Put': {
+                'TableName': Config.DYNAMODB_ORDERS_TABLE,
+                'Item': serialize(new_item),
+                'ConditionExpression': 'attribute_not_exists(order_id)'
+            }
+        },
+        {
+            'Delete': {
+                'TableName': Config.DYNAMODB_ORDERS_TABLE,
+                'Key': serialize({'user_id': order['user_id'], 'order_id': order['order_id']}),
+                'ConditionExpression': 'attribute_exists(order_id)'
+            }
+        }
+    ])
+    return new_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backfill time-ordered order IDs')
+    parser.add_argument('--dry-run', action='store_true', help='only count legacy orders')
+    args = parser.parse_args()
+
+    try:
+        logger.info("=" * 60)
+        logger.info("Orders ID Backfill" + (" (dry run)" if args.dry_run else ""))
+        logger.info("=" * 60)
+
+        moved = 0
+        counted = 0
+        failed = 0
+        for order in orders_to_backfill():
+            legacy = not is_time_ordered(order['order_id'])
+            if args.dry_run:
+                moved += legacy
+                counted += not legacy
+                continue
+
+            try:
+                if legacy:
+                    new_id = rekey_order(order)
+                    moved += 1
+                    logger.debug(f"  {order['order_id']} -> {new_id}")
+                else:
+                    add_item_count(order)
+                    counted += 1
+                if (moved + counted) % 100 == 0:
+                    logger.info(f"  {moved + counted} orders updated...")
+            except ClientError as e:
+                # Usually the order was changed or re-keyed concurrently; a rerun picks it up
+                failed += 1
+                logger.warning(f"  Could not update {order['order_id']}: {e}")
+
+        logger.info("\n" + "=" * 60)
+        if args.dry_run:
+            logger.info(f"{moved} orders would be re-keyed, {counted} more need item_count")
+        else:
+            logger.info(f"✓ BACKFILL COMPLETE: {moved} orders re-keyed, "
+                        f"{counted} given item_count, {failed} failed")
+        logger.info("=" * 60)
+
+    except Exception as e:
+        logger.error(f"\n✗ Backfill failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
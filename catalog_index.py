@@ -0,0 +1,139 @@
+"""
+Base class for in-memory indexes over the product catalog
+Indexes build lazily from the (cached) catalog and follow product writes; periodic
+rebuilds load a fresh copy in the background and swap it in
+"""
+from aws_dynamodb import dynamodb_manager
+from config import Config
+from abc import ABC, abstractmethod
+import copy
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogIndex(ABC):
+    """Lazily built in-memory index, patched on product writes and rebuilt periodically"""
+
+    # Bookkeeping kept on the live index when a rebuilt copy is swapped in
+    _CONTROL_ATTRS = ('refresh_seconds', '_lock', '_build_lock', '_built_at', '_pending', '_refreshing')
+
+    def __init__(self, refresh_seconds=None):
+        self.refresh_seconds = refresh_seconds if refresh_seconds is not None else Config.CATALOG_INDEX_REFRESH
+        self._lock = threading.RLock()        # guards the index structures
+        self._build_lock = threading.RLock()  # one rebuild at a time
+        self._built_at = None
+        self._pending = None                  # writes seen while a rebuild runs
+        self._refreshing = False
+        self._clear()
+        dynamodb_manager.add_product_listener(self.on_product_change)
+
+    def _is_fresh(self):
+        return (self._built_at is not None
+                and time.monotonic() - self._built_at < self.refresh_seconds)
+
+    def ensure_built(self, wait=True):
+        """
+        Build the index on first use (callers wait, there is nothing to serve yet;
+        wait=False starts the build in the background instead). Once it is older than
+        refresh_seconds, rebuild in the background and keep serving the stale index
+        until the new one is swapped in. Returns whether there is an index to serve.
+        """
+        if self._is_fresh():
+            return True
+
+        if self._built_at is None and wait:
+            with self._build_lock:
+                if self._built_at is None:
+                    self._build()
+            return True
+
+        with self._lock:
+            if not self._refreshing:
+                self._refreshing = True
+                threading.Thread(target=self._refresh, name=f"{type(self).__name__}-refresh", daemon=True).start()
+            return self._built_at is not None
+
+    def _build(self):
+        with self._build_lock:
+            with self._lock:
+                self._pending = []  # capture writes racing the catalog read too
+            try:
+                products = dynamodb_manager.get_all_products()
+                self.rebuild(products)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+        logger.info(f"{type(self).__name__} built from {len(products)} products")
+
+    def _refresh(self):
+        try:
+            self._build()
+        except Exception as e:
+            logger.error(f"{type(self).__name__} refresh failed, serving the previous index: {e}")
+            with self._lock:
+                if self._built_at is not None:
+                    self._built_at = time.monotonic()  # retry after another refresh interval
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def rebuild(self, products):
+        """
+        Replace the index contents with the given products. The new index is built on
+        a copy outside the lock; writes arriving meanwhile are replayed onto it before
+        it is swapped in, so readers only ever wait for the swap.
+        """
+        with self._build_lock:
+            with self._lock:
+                if self._pending is None:
+                    self._pending = []
+
+            staged = copy.copy(self)
+            staged._clear()
+            staged._load(products)
+
+            with self._lock:
+                for action, product in self._pending:
+                    staged._apply(action, product)
+                for name, value in vars(staged).items():
+                    if name not in self._CONTROL_ATTRS:
+                        setattr(self, name, value)
+                self._pending = None
+                self._built_at = time.monotonic()
+
+    def on_product_change(self, action, product):
+        """Product listener: apply a create/update/delete to the built index and any rebuild in progress"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((action, product))
+            if self._built_at is None:
+                return  # The rebuild in progress replays the write, or the next one reads it
+            self._apply(action, product)
+
+    def _apply(self, action, product):
+        self._remove(product['product_id'])
+        if action != 'delete':
+            self._add(product)
+
+    def _load(self, products):
+        """Index a full catalog into an empty index; override to bulk-load faster than _add"""
+        for product in products:
+            self._add(product)
+
+    # Subclasses implement the index structure
+
+    @abstractmethod
+    def _clear(self):
+        """Reset to an empty index"""
+
+    @abstractmethod
+    def _add(self, product):
+        """Index one product"""
+
+    @abstractmethod
+    def _remove(self, product_id):
+        """Drop one product if indexed"""
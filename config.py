@@ -30,6 +30,13 @@ class Config:
     RDS_USERNAME = os.getenv('RDS_USERNAME', 'postgres')
     RDS_PASSWORD = os.getenv('RDS_PASSWORD', '')
     
+    # RDS connection pool: connections kept open, recycled after max lifetime / idle time
+    RDS_POOL_MIN_SIZE = int(os.getenv('RDS_POOL_MIN_SIZE', 2))
+    RDS_POOL_MAX_SIZE = int(os.getenv('RDS_POOL_MAX_SIZE', 10))
+    RDS_POOL_MAX_LIFETIME = float(os.getenv('RDS_POOL_MAX_LIFETIME', 1800))  # seconds
+    RDS_POOL_MAX_IDLE = float(os.getenv('RDS_POOL_MAX_IDLE', 300))  # seconds
+    RDS_POOL_TIMEOUT = float(os.getenv('RDS_POOL_TIMEOUT', 5))  # seconds to wait for a connection
+    
     # DynamoDB Settings (for Products, Orders, Cart)
     DYNAMODB_ENDPOINT = os.getenv('DYNAMODB_ENDPOINT', None)  # None for AWS, set URL for local
     
@@ -37,6 +44,60 @@ class Config:
     DYNAMODB_PRODUCTS_TABLE = os.getenv('DYNAMODB_PRODUCTS_TABLE', 'Products')
     DYNAMODB_ORDERS_TABLE = os.getenv('DYNAMODB_ORDERS_TABLE', 'Orders')
     DYNAMODB_CART_TABLE = os.getenv('DYNAMODB_CART_TABLE', 'Cart')
+    DYNAMODB_INVENTORY_TABLE = os.getenv('DYNAMODB_INVENTORY_TABLE', 'Inventory')
+    DYNAMODB_IDEMPOTENCY_TABLE = os.getenv('DYNAMODB_IDEMPOTENCY_TABLE', 'Idempotency')
+    DYNAMODB_ANALYTICS_TABLE = os.getenv('DYNAMODB_ANALYTICS_TABLE', 'Analytics')
+    DYNAMODB_RECOMMENDATIONS_TABLE = os.getenv('DYNAMODB_RECOMMENDATIONS_TABLE', 'Recommendations')
+    
+    # Parallel scan segments for full-table reads
+    DYNAMODB_SCAN_SEGMENTS = int(os.getenv('DYNAMODB_SCAN_SEGMENTS', 4))
+    
+    # Carts untouched for this long are deleted by DynamoDB TTL (Cart.expires_at)
+    CART_TTL_DAYS = int(os.getenv('CART_TTL_DAYS', 30))
+    
+    # Write-behind cart saves (buffered in process, flushed with BatchWriteItem)
+    CART_WRITE_BEHIND = os.getenv('CART_WRITE_BEHIND', 'False').lower() == 'true'
+    CART_BUFFER_MAX_ENTRIES = int(os.getenv('CART_BUFFER_MAX_ENTRIES', 10000))
+    CART_FLUSH_INTERVAL = float(os.getenv('CART_FLUSH_INTERVAL', 1.0))  # seconds
+    
+    # Sharded inventory: summed shard reads are cached, shards are evened out periodically
+    INVENTORY_CACHE_TTL = float(os.getenv('INVENTORY_CACHE_TTL', 2.0))  # seconds
+    INVENTORY_REBALANCE_INTERVAL = int(os.getenv('INVENTORY_REBALANCE_INTERVAL', 30))  # seconds, 0 = off
+    
+    # Post-order pipeline: durable SQLite job queue drained by order_worker.py processes
+    ORDER_QUEUE_PATH = os.getenv('ORDER_QUEUE_PATH', 'order_queue.db')
+    ORDER_WORKERS = int(os.getenv('ORDER_WORKERS', 2))
+    ORDER_JOB_LEASE = int(os.getenv('ORDER_JOB_LEASE', 60))  # seconds a worker may hold a job
+    # Jobs are queued before checkout; a job whose order is still missing after this is dropped
+    ORDER_PENDING_GRACE = int(os.getenv('ORDER_PENDING_GRACE', 60))  # seconds
+    
+    # Idempotency-Key replay window, and completed responses kept in process
+    IDEMPOTENCY_TTL_HOURS = int(os.getenv('IDEMPOTENCY_TTL_HOURS', 24))
+    IDEMPOTENCY_CACHE_MAX_ENTRIES = int(os.getenv('IDEMPOTENCY_CACHE_MAX_ENTRIES', 10000))
+    
+    # Sales analytics rollups are cached in process for this long (seconds)
+    ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', 60))
+    # Partitions each rollup's increments are spread over (reads query all of them; only
+    # lower it right before an analytics rebuild, or rows in the dropped shards are missed)
+    ANALYTICS_WRITE_SHARDS = int(os.getenv('ANALYTICS_WRITE_SHARDS', 8))
+    
+    # Co-purchase recommendations: neighbours stored per product, and the in-process lookup cache
+    RECOMMENDATIONS_MAX_NEIGHBOURS = int(os.getenv('RECOMMENDATIONS_MAX_NEIGHBOURS', 50))
+    RECOMMENDATIONS_CACHE_TTL = int(os.getenv('RECOMMENDATIONS_CACHE_TTL', 300))  # seconds
+    RECOMMENDATIONS_CACHE_MAX_ENTRIES = int(os.getenv('RECOMMENDATIONS_CACHE_MAX_ENTRIES', 10000))
+    
+    # Index Names
+    DYNAMODB_PRODUCTS_CATEGORY_INDEX = os.getenv('DYNAMODB_PRODUCTS_CATEGORY_INDEX', 'category-index')
+    
+    # Product catalog cache (set PRODUCT_CACHE_TTL=0 to disable)
+    PRODUCT_CACHE_TTL = int(os.getenv('PRODUCT_CACHE_TTL', 60))  # seconds
+    PRODUCT_CACHE_MAX_ENTRIES = int(os.getenv('PRODUCT_CACHE_MAX_ENTRIES', 64))  # cached listings
+    
+    # In-memory catalog indexes (search, suggest, ...) fully rebuild after this many seconds
+    CATALOG_INDEX_REFRESH = int(os.getenv('CATALOG_INDEX_REFRESH', 300))
+    
+    # Price band edges for /api/products/facets (in CURRENCY; last band is open-ended)
+    PRICE_FACET_EDGES = os.getenv('PRICE_FACET_EDGES', '0,500000,1000000,2500000,5000000,10000000,20000000')
     
     # JWT Settings
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', SECRET_KEY)
@@ -44,6 +105,8 @@ class Config:
     
     # E-Commerce Settings
     ITEMS_PER_PAGE = int(os.getenv('ITEMS_PER_PAGE', 12))
+    MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 100))
+    MAX_BATCH_PRODUCTS = int(os.getenv('MAX_BATCH_PRODUCTS', 300))
     CURRENCY = os.getenv('CURRENCY', 'IDR')
     TAX_RATE = float(os.getenv('TAX_RATE', 0.11))  # 11% PPN
     
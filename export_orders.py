@@ -0,0 +1,167 @@
+"""
+Stream the Orders table to compressed, chunked files for finance reconciliation
+parallel scan -> order lines -> fixed-size chunks -> one file per chunk, so memory is
+bounded by the chunk size and throughput follows the number of scan segments.
+Writes Parquet (zstd) when pyarrow is installed, otherwise gzip NDJSON, plus manifest.json.
+Run: python export_orders.py exports/2026-03 [--segments 8] [--chunk-rows 100000]
+"""
+from config import Config
+from aws_dynamodb import dynamodb_manager
+from order_rollups import flatten_orders
+from datetime import datetime
+import argparse
+import gzip
+import json
+import logging
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: pip install pyarrow
+    pa = None
+    pq = None
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 100000
+MANIFEST_NAME = 'manifest.json'
+
+# Column order of every export file
+LINE_COLUMNS = (
+    ('order_id', 'string'), ('user_id', 'string'), ('created_at', 'string'), ('day', 'string'),
+    ('product_id', 'string'), ('category', 'string'), ('name', 'string'),
+    ('quantity', 'int64'), ('price', 'float64'), ('revenue', 'float64')
+)
+
+
+def chunked(lines, size):
+    """Group a stream into lists of up to size items"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ParquetWriter:
+    extension = '.parquet'
+    format = 'parquet'
+
+    def __init__(self):
+        self.schema = pa.schema([(name, getattr(pa, kind)()) for name, kind in LINE_COLUMNS])
+
+    def write(self, path, rows):
+        columns = {name: [row.get(name) for row in rows] for name, _ in LINE_COLUMNS}
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        pq.write_table(table, path, compression='zstd')
+
+
+class NDJSONWriter:
+    extension = '.ndjson.gz'
+    format = 'ndjson'
+
+    def write(self, path, rows):
+        with gzip.open(path, 'wt', encoding='utf-8') as out:
+            for row in rows:
+                out.write(json.dumps({name: row.get(name) for name, _ in LINE_COLUMNS}))
+                out.write('\n')
+
+
+def get_writer(file_format='auto'):
+    """Parquet when pyarrow is available (or requested), else gzip NDJSON"""
+    if file_format == 'parquet' or (file_format == 'auto' and pa is not None):
+        if pa is None:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+        return ParquetWriter()
+    return NDJSONWriter()
+
+
+def export_orders(output_dir, segments=None, chunk_rows=DEFAULT_CHUNK_ROWS, file_format='auto'):
+    """Export every order line to output_dir; returns the manifest"""
+    writer = get_writer(file_format)
+    os.makedirs(output_dir, exist_ok=True)
+
+    started_at = datetime.now().isoformat()
+    orders = dynamodb_manager.parallel_scan(Config.DYNAMODB_ORDERS_TABLE, total_segments=segments)
+
+    files = []
+    total_rows = 0
+    for part, rows in enumerate(chunked(flatten_orders(orders), chunk_rows)):
+        name = f"part-{part:05d}{writer.extension}"
+        path = os.path.join(output_dir, name)
+        # Readers only ever see complete parts
+        writer.write(path + '.tmp', rows)
+        os.replace(path + '.tmp', path)
+
+        files.append({'path': name, 'rows': len(rows)})
+        total_rows += len(rows)
+        logger.info(f"  {name}: {len(rows)} lines ({total_rows} total)")
+
+    manifest = {
+        'table': Config.DYNAMODB_ORDERS_TABLE,
+        'format': writer.format,
+        'columns': [{'name': name, 'type': kind} for name, kind in LINE_COLUMNS],
+        'files': files,
+        'rows': total_rows,
+        'segments': segments or Config.DYNAMODB_SCAN_SEGMENTS,
+        'started_at': started_at,
+        'finished_at': datetime.now().isoformat()
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as out:
+        json.dump(manifest, out, indent=2)
+
+    return manifest
+
+
+def read_export(export_dir):
+    """Stream the order lines of an export back, part by part, in export order"""
+    with open(os.path.join(export_dir, MANIFEST_NAME)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    for entry in manifest['files']:
+        path = os.path.join(export_dir, entry['path'])
+        if manifest['format'] == 'parquet':
+            if pq is None:
+                raise RuntimeError("Reading a Parquet export needs pyarrow (pip install pyarrow)")
+            for batch in pq.ParquetFile(path).iter_batches():
+                yield from batch.to_pylist()
+        else:
+            with gzip.open(path, 'rt', encoding='utf-8') as lines:
+                for line in lines:
+                    yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export order lines to compressed chunked files')
+    parser.add_argument('output_dir')
+    parser.add_argument('--segments', type=int, default=None,
+                        help=f'parallel scan segments (default {Config.DYNAMODB_SCAN_SEGMENTS})')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS,
+                        help='order lines per output file')
+    parser.add_argument('--format', choices=['auto', 'parquet', 'ndjson'], default='auto')
+    args = parser.parse_args()
+
+    try:
+        logger.info("=" * 60)
+        logger.info(f"Orders Export -> {args.output_dir}")
+        logger.info("=" * 60)
+
+        manifest = export_orders(args.output_dir, args.segments, args.chunk_rows, args.format)
+
+        logger.info("\n" + "=" * 60)
+        logger.info(f"✓ EXPORT COMPLETE: {manifest['rows']} lines in {len(manifest['files'])} "
+                    f"{manifest['format']} files")
+        logger.info("=" * 60)
+
+    except Exception as e:
+        logger.error(f"\n✗ Export failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
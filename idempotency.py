@@ -0,0 +1,192 @@
+"""
+Idempotency-Key support for retried POST requests
+The first request with a key reserves it in DynamoDB and stores its response;
+retries replay that response from an in-process LRU, else from the table
+"""
+from aws_dynamodb import dynamodb_manager
+from config import Config
+from botocore.exceptions import ClientError
+from flask import request, jsonify, make_response, Response
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+import hashlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+IN_PROGRESS_SECONDS = 60  # a reservation left by a crashed request frees up after this
+
+
+class IdempotencyStore:
+    """Completed responses by scoped key: LRU in process, DynamoDB (with TTL) across processes"""
+
+    def __init__(self, ttl_seconds, max_entries):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # scoped key -> completed record
+        self._lock = threading.Lock()
+
+    def _table(self):
+        return dynamodb_manager.dynamodb_resource.Table(Config.DYNAMODB_IDEMPOTENCY_TABLE)
+
+    def cached(self, key):
+        """Completed record from the in-process LRU, or None"""
+        with self._lock:
+            record = self._cache.get(key)
+            if record is None:
+                return None
+            if record['expires_at'] <= time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return record
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._cache[key] = record
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def reserve(self, key, fingerprint):
+        """
+        Claim a key for a new request. Returns (True, None) when this request should run,
+        or (False, record) with the existing in-progress or completed record.
+        """
+        table = self._table()
+
+        for _ in range(2):
+            # Read first: replaying a completed request must not cost a write
+            now = int(time.time())
+            item = table.get_item(Key={'idempotency_key': key}, ConsistentRead=True).get('Item')
+            if item is not None and int(item['expires_at']) >= now:
+                record = {
+                    'state': item['state'],
+                    'fingerprint': item['fingerprint'],
+                    'status_code': int(item.get('status_code', 0)),
+                    'body': item.get('body', ''),
+                    'content_type': item.get('content_type', 'application/json'),
+                    'expires_at': int(item['expires_at'])
+                }
+                if record['state'] == 'done':
+                    self._remember(key, record)
+                return False, record
+
+            try:
+                table.put_item(
+                    Item={
+                        'idempotency_key': key,
+                        'state': 'in_progress',
+                        'fingerprint': fingerprint,
+                        'created_at': datetime.now().isoformat(),
+                        'expires_at': now + IN_PROGRESS_SECONDS
+                    },
+                    ConditionExpression='attribute_not_exists(idempotency_key) OR expires_at < :now',
+                    ExpressionAttributeValues={':now': now}
+                )
+                return True, None
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+            # A concurrent request reserved the key first; read its record
+
+        raise RuntimeError(f"Could not reserve idempotency key {key}")
+
+    def complete(self, key, fingerprint, response):
+        """Store the response for replay until the key expires"""
+        record = {
+            'state': 'done',
+            'fingerprint': fingerprint,
+            'status_code': response.status_code,
+            'body': response.get_data(as_text=True),
+            'content_type': response.content_type,
+            'expires_at': int(time.time()) + self.ttl_seconds
+        }
+        self._table().put_item(Item=dict(record, idempotency_key=key))
+        self._remember(key, record)
+
+    def release(self, key):
+        """Drop a reservation so the client can retry (the request failed server-side)"""
+        self._table().delete_item(Key={'idempotency_key': key})
+
+
+def _replay(record):
+    response = Response(record['body'], status=record['status_code'], content_type=record['content_type'])
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(f):
+    """
+    Decorator for POST routes (inside @token_required): requests carrying an
+    Idempotency-Key header run once per user and key; retries get the first response
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'
+            }), 400
+
+        user_id = (kwargs.get('current_user') or {}).get('user_id', '')
+        scoped_key = f"{user_id}:{request.method}:{request.path}:{key}"
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        record = idempotency_store.cached(scoped_key)
+        if record is None:
+            try:
+                reserved, record = idempotency_store.reserve(scoped_key, fingerprint)
+            except Exception as e:
+                # The key store being down should not take the endpoint down with it
+                logger.error(f"Idempotency store unavailable, running request unguarded: {e}")
+                return f(*args, **kwargs)
+
+            if reserved:
+                try:
+                    response = make_response(f(*args, **kwargs))
+                except Exception:
+                    idempotency_store.release(scoped_key)
+                    raise
+
+                try:
+                    if response.status_code >= 500:
+                        idempotency_store.release(scoped_key)
+                    else:
+                        idempotency_store.complete(scoped_key, fingerprint, response)
+                except Exception as e:
+                    logger.error(f"Error storing idempotent response for {scoped_key}: {e}")
+                return response
+
+        if record['fingerprint'] != fingerprint:
+            return jsonify({
+                'success': False,
+                'error': f'{IDEMPOTENCY_HEADER} was already used with a different request body'
+            }), 422
+
+        if record['state'] != 'done':
+            return jsonify({
+                'success': False,
+                'error': 'A request with this Idempotency-Key is still being processed'
+            }), 409
+
+        return _replay(record)
+
+    return decorated
+
+
+# Singleton instance
+idempotency_store = IdempotencyStore(
+    ttl_seconds=Config.IDEMPOTENCY_TTL_HOURS * 3600,
+    max_entries=Config.IDEMPOTENCY_CACHE_MAX_ENTRIES
+)
@@ -0,0 +1,404 @@
+"""
+Sharded inventory counters for hot products
+A sharded product's stock lives in N Inventory items (product_id, shard) instead of
+the single Products.stock attribute, so flash-sale decrements spread their writes.
+Products.stock is kept as an eventually consistent display total.
+The registry of sharded products is reloaded by a background thread; the rebalancer
+runs only where start_rebalancer() is called (the order worker supervisor).
+"""
+from config import Config
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+import atexit
+import logging
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_SHARDS = 50                # enable/disable touch every shard in one transaction
+REGISTRY_REFRESH_SECONDS = 30  # how often other processes' enable/disable are picked up
+REGISTRY_RETRY_SECONDS = 5     # retry delay after a failed registry load
+
+
+def split_stock(total, shards):
+    """Split total into shards near-equal parts, e.g. (10, 3) -> [4, 3, 3]"""
+    base, extra = divmod(int(total), shards)
+    return [base + (1 if shard < extra else 0) for shard in range(shards)]
+
+
+class ShardedInventory:
+    """
+    Shard registry (refreshed in the background), conditional shard decrements for
+    checkout, cached summed reads, and a rebalancer that evens shards out and syncs
+    Products.stock.
+    """
+
+    def __init__(self, manager, cache_ttl, rebalance_interval):
+        self.manager = manager
+        self.cache_ttl = cache_ttl
+        self.rebalance_interval = rebalance_interval
+        self._serializer = TypeSerializer()
+        self._lock = threading.Lock()
+        self._registry = {}         # product_id -> shard count
+        self._stock = {}            # product_id -> (expires_at, {shard: stock})
+        self._stop = threading.Event()
+        self._refresher = None
+        self._rebalancer = None
+
+    def _table(self):
+        return self.manager.dynamodb_resource.Table(Config.DYNAMODB_INVENTORY_TABLE)
+
+    def _serialize(self, value):
+        return {k: self._serializer.serialize(v) for k, v in value.items()}
+
+    # Registry
+
+    def refresh(self):
+        """Reload which products are sharded (picks up enable/disable from other processes)"""
+        registry = {}
+        try:
+            for item in self.manager.parallel_scan(
+                Config.DYNAMODB_INVENTORY_TABLE,
+                ProjectionExpression='product_id, shard_count'
+            ):
+                registry[item['product_id']] = int(item['shard_count'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+
+        with self._lock:
+            self._registry = registry
+        return registry
+
+    def refresh_product(self, product_id):
+        """Re-read one product's shards (one Query), e.g. after checkout saw a stale registry"""
+        shards = self.read_shards(product_id, consistent=True)
+        with self._lock:
+            if shards:
+                self._registry[product_id] = len(shards)
+            else:
+                self._registry.pop(product_id, None)
+        return len(shards)
+
+    def shard_count(self, product_id, exact=False):
+        """
+        Number of stock shards for a product, or 0 when its stock is not sharded.
+        Served from the background-refreshed registry; exact=True queries the table.
+        Checkout does not need exact: a stale answer fails its stock condition and retries.
+        """
+        if exact:
+            return self.refresh_product(product_id)
+        self.start()
+        with self._lock:
+            return self._registry.get(product_id, 0)
+
+    def sharded_products(self):
+        """Return {product_id: shard count} for all sharded products"""
+        self.start()
+        with self._lock:
+            return dict(self._registry)
+
+    # Reads
+
+    def read_shards(self, product_id, consistent=False):
+        """Read {shard: stock} for a product straight from the Inventory table"""
+        response = self._table().query(
+            KeyConditionExpression=Key('product_id').eq(product_id),
+            ProjectionExpression='shard, stock',
+            ConsistentRead=consistent
+        )
+        shards = {int(item['shard']): int(item['stock']) for item in response.get('Items', [])}
+
+        with self._lock:
+            self._stock[product_id] = (time.monotonic() + self.cache_ttl, shards)
+        return shards
+
+    def get_stock(self, product_id, refresh=False):
+        """Total stock across all shards, cached for cache_ttl seconds"""
+        with self._lock:
+            cached = self._stock.get(product_id)
+
+        if refresh or not cached or cached[0] <= time.monotonic():
+            shards = self.read_shards(product_id, consistent=refresh)
+        else:
+            shards = cached[1]
+        return sum(shards.values())
+
+    # Checkout
+
+    def plan_decrement(self, product_id, quantity, fresh=False):
+        """
+        {shard: units} to take quantity from, per the (cached) shard counts: one random
+        shard when a single shard holds it all, else the fullest shards in turn.
+        Returns None when the shards do not hold quantity in total.
+        """
+        with self._lock:
+            cached = self._stock.get(product_id)
+        if fresh or not cached or cached[0] <= time.monotonic():
+            shards = self.read_shards(product_id, consistent=fresh)
+        else:
+            shards = dict(cached[1])
+
+        enough = [shard for shard, stock in shards.items() if stock >= quantity]
+        if enough:
+            return {random.choice(enough): quantity}
+
+        plan = {}
+        remaining = quantity
+        # Fullest first (random among equals), so the line touches as few shards as possible
+        for shard in sorted(shards, key=lambda shard: (-shards[shard], random.random())):
+            if remaining <= 0 or shards[shard] <= 0:
+                break
+            take = min(shards[shard], remaining)
+            plan[shard] = take
+            remaining -= take
+        return plan if remaining <= 0 else None
+
+    def decrement_action(self, product_id, shard, quantity):
+        """TransactWriteItems Update taking quantity from one shard, never below zero"""
+        return {
+            'Update': {
+                'TableName': Config.DYNAMODB_INVENTORY_TABLE,
+                'Key': self._serialize({'product_id': product_id, 'shard': shard}),
+                'UpdateExpression': 'SET #stock = #stock - :qty',
+                'ConditionExpression': '#stock >= :qty',
+                'ExpressionAttributeNames': {'#stock': 'stock'},
+                'ExpressionAttributeValues': {':qty': {'N': str(quantity)}},
+                'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+            }
+        }
+
+    def note_decrement(self, product_id, shard, quantity):
+        """Apply a committed decrement to the cached shard counts"""
+        with self._lock:
+            cached = self._stock.get(product_id)
+            if cached and shard in cached[1]:
+                cached[1][shard] -= quantity
+
+    # Admin
+
+    def enable(self, product_id, shards):
+        """Move a product's stock into shards (one transaction); returns the shard counts"""
+        if not 2 <= shards <= MAX_SHARDS:
+            raise ValueError(f"shards must be between 2 and {MAX_SHARDS}")
+        if self.shard_count(product_id, exact=True):
+            raise ValueError(f"Product {product_id} is already sharded")
+
+        product = self.manager.get_product(product_id)
+        if not product:
+            return None
+
+        total = int(product.get('stock') or 0)
+        counts = split_stock(total, shards)
+
+        actions = [{
+            'Update': {
+                'TableName': Config.DYNAMODB_PRODUCTS_TABLE,
+                'Key': self._serialize({'product_id': product_id, 'category': product['category']}),
+                'UpdateExpression': 'SET #shards = :shards',
+                # Orders placed since the read would otherwise be lost from the split
+                'ConditionExpression': '#stock = :seen AND attribute_not_exists(#shards)',
+                'ExpressionAttributeNames': {'#stock': 'stock', '#shards': 'stock_shards'},
+                'ExpressionAttributeValues': {':shards': {'N': str(shards)}, ':seen': {'N': str(total)}}
+            }
+        }]
+        for shard, stock in enumerate(counts):
+            actions.append({
+                'Put': {
+                    'TableName': Config.DYNAMODB_INVENTORY_TABLE,
+                    'Item': self._serialize({
+                        'product_id': product_id, 'shard': shard,
+                        'shard_count': shards, 'stock': stock
+                    })
+                }
+            })
+
+        try:
+            self.manager.dynamodb_client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                raise ValueError("Product stock changed while sharding, please retry")
+            raise
+
+        with self._lock:
+            self._registry[product_id] = shards
+            self._stock[product_id] = (time.monotonic() + self.cache_ttl, dict(enumerate(counts)))
+
+        logger.info(f"Inventory sharded: {product_id} ({total} units over {shards} shards)")
+        return counts
+
+    def disable(self, product_id):
+        """Fold the shards back into Products.stock and delete them; returns the total"""
+        category = self.manager.resolve_category(product_id)
+        shards = self.read_shards(product_id, consistent=True)
+        if not category or not shards:
+            return None
+
+        total = sum(shards.values())
+        actions = [{
+            'Update': {
+                'TableName': Config.DYNAMODB_PRODUCTS_TABLE,
+                'Key': self._serialize({'product_id': product_id, 'category': category}),
+                'UpdateExpression': 'SET #stock = :total REMOVE #shards',
+                'ExpressionAttributeNames': {'#stock': 'stock', '#shards': 'stock_shards'},
+                'ExpressionAttributeValues': {':total': {'N': str(total)}}
+            }
+        }]
+        for shard, stock in shards.items():
+            actions.append({
+                'Delete': {
+                    'TableName': Config.DYNAMODB_INVENTORY_TABLE,
+                    'Key': self._serialize({'product_id': product_id, 'shard': shard}),
+                    'ConditionExpression': '#stock = :seen',
+                    'ExpressionAttributeNames': {'#stock': 'stock'},
+                    'ExpressionAttributeValues': {':seen': {'N': str(stock)}}
+                }
+            })
+
+        try:
+            self.manager.dynamodb_client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                raise ValueError("Shards changed while unsharding, please retry")
+            raise
+
+        with self._lock:
+            self._registry.pop(product_id, None)
+            self._stock.pop(product_id, None)
+
+        product = self.manager.get_product(product_id, category)
+        if product:
+            self.manager.catalog_cache.upsert(product)
+            self.manager._notify_product_change('update', product)
+        logger.info(f"Inventory unsharded: {product_id} ({total} units)")
+        return total
+
+    def set_stock(self, product_id, total):
+        """Set a sharded product's total stock (e.g. a restock), spread evenly over its shards"""
+        total = int(total)
+        if total < 0:
+            raise ValueError("stock cannot be negative")
+        return self._write_shards(product_id, lambda current: total)
+
+    def rebalance(self, product_id):
+        """Even out a product's shards without changing the total; False if it lost a race"""
+        return self._write_shards(product_id, sum, skip_balanced=True)
+
+    def _write_shards(self, product_id, target_total, skip_balanced=False):
+        shards = self.read_shards(product_id, consistent=True)
+        if not shards:
+            return False
+
+        current = sum(shards.values())
+        total = target_total(shards.values())
+        counts = split_stock(total, len(shards))
+
+        if skip_balanced and max(shards.values()) - min(shards.values()) <= 1:
+            self._sync_product_stock(product_id, total)
+            return True
+
+        # Every shard must still hold what was read, so concurrent orders are never overwritten
+        actions = []
+        for shard, stock in sorted(shards.items()):
+            actions.append({
+                'Update': {
+                    'TableName': Config.DYNAMODB_INVENTORY_TABLE,
+                    'Key': self._serialize({'product_id': product_id, 'shard': shard}),
+                    'UpdateExpression': 'SET #stock = :new',
+                    'ConditionExpression': '#stock = :seen',
+                    'ExpressionAttributeNames': {'#stock': 'stock'},
+                    'ExpressionAttributeValues': {
+                        ':new': {'N': str(counts[shard])},
+                        ':seen': {'N': str(stock)}
+                    }
+                }
+            })
+
+        try:
+            self.manager.dynamodb_client.transact_write_items(TransactItems=actions)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'TransactionCanceledException':
+                logger.info(f"Shard write for {product_id} raced with orders; will retry later")
+                return False
+            raise
+
+        with self._lock:
+            self._stock[product_id] = (time.monotonic() + self.cache_ttl, dict(enumerate(counts)))
+
+        self._sync_product_stock(product_id, total)
+        logger.info(f"Inventory shards written: {product_id} ({current} -> {total} units)")
+        return True
+
+    def _sync_product_stock(self, product_id, total):
+        """Copy the shard total into Products.stock for listings (skipped when unchanged)"""
+        category = self.manager.resolve_category(product_id)
+        if not category:
+            return
+
+        table = self.manager.dynamodb_resource.Table(Config.DYNAMODB_PRODUCTS_TABLE)
+        try:
+            response = table.update_item(
+                Key={'product_id': product_id, 'category': category},
+                UpdateExpression='SET #stock = :total',
+                ConditionExpression='attribute_exists(#shards) AND #stock <> :total',
+                ExpressionAttributeNames={'#stock': 'stock', '#shards': 'stock_shards'},
+                ExpressionAttributeValues={':total': total},
+                ReturnValues='ALL_NEW'
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return
+            raise
+
+        item = response['Attributes']
+        if 'price' in item:
+            item['price'] = float(item['price'])
+        self.manager.catalog_cache.upsert(item)
+        self.manager._notify_product_change('update', item)
+
+    # Background threads
+
+    def start(self):
+        """Start the registry refresher (first load happens right away, off the caller's thread)"""
+        if self._refresher is not None:
+            return
+        with self._lock:
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, name='inventory-registry',
+                                                   daemon=True)
+                self._refresher.start()
+                atexit.register(self.stop)
+
+    def _refresh_loop(self):
+        wait = 0
+        while not self._stop.wait(wait):
+            try:
+                self.refresh()
+                wait = REGISTRY_REFRESH_SECONDS
+            except Exception as e:
+                logger.error(f"Error loading inventory shards: {e}")
+                wait = REGISTRY_RETRY_SECONDS
+
+    def start_rebalancer(self):
+        """Run the rebalancer in this process; call it from one long-running process only"""
+        self.start()
+        with self._lock:
+            if self._rebalancer is None and self.rebalance_interval > 0:
+                self._rebalancer = threading.Thread(target=self._rebalance_loop, name='inventory-rebalancer',
+                                                    daemon=True)
+                self._rebalancer.start()
+
+    def _rebalance_loop(self):
+        while not self._stop.wait(self.rebalance_interval):
+            for product_id in self.sharded_products():
+                try:
+                    self.rebalance(product_id)
+                except Exception as e:
+                    logger.error(f"Error rebalancing inventory for {product_id}: {e}")
+
+    def stop(self):
+        """Stop the registry refresher and the rebalancer"""
+        self._stop.set()
@@ -0,0 +1,94 @@
+"""
+Add the category GSI to an existing Products table
+DynamoDB backfills the index from existing items; this script waits until it is ACTIVE
+Run: python migrate_category_index.py
+"""
+from config import Config
+from aws_dynamodb import dynamodb_manager
+import logging
+import time
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 15
+
+
+def find_category_index():
+    """Return the category GSI description, or None if it does not exist yet"""
+    description = dynamodb_manager.dynamodb_client.describe_table(
+        TableName=Config.DYNAMODB_PRODUCTS_TABLE
+    )['Table']
+
+    for index in description.get('GlobalSecondaryIndexes', []):
+        if index['IndexName'] == Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX:
+            return index
+    return None
+
+
+def create_category_index():
+    """Request creation of the category GSI on the Products table"""
+    dynamodb_manager.dynamodb_client.update_table(
+        TableName=Config.DYNAMODB_PRODUCTS_TABLE,
+        AttributeDefinitions=[
+            {'AttributeName': 'product_id', 'AttributeType': 'S'},
+            {'AttributeName': 'category', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexUpdates=[
+            {
+                'Create': {
+                    'IndexName': Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX,
+                    'KeySchema': [
+                        {'AttributeName': 'category', 'KeyType': 'HASH'},
+                        {'AttributeName': 'product_id', 'KeyType': 'RANGE'}
+                    ],
+                    'Projection': {'ProjectionType': 'ALL'}
+                }
+            }
+        ]
+    )
+    logger.info(f"Requested index '{Config.DYNAMODB_PRODUCTS_CATEGORY_INDEX}'")
+
+
+def wait_until_active():
+    """Poll until the index has finished backfilling"""
+    while True:
+        index = find_category_index()
+        status = index.get('IndexStatus') if index else 'MISSING'
+
+        if status == 'ACTIVE':
+            logger.info(f"✓ Index is ACTIVE ({index.get('ItemCount', 0)} items)")
+            return
+
+        backfilling = ' (backfilling)' if index and index.get('Backfilling') else ''
+        logger.info(f"Index status: {status}{backfilling}, checking again in {POLL_SECONDS}s...")
+        time.sleep(POLL_SECONDS)
+
+
+def main():
+    try:
+        logger.info("=" * 60)
+        logger.info("Products Category Index Migration")
+        logger.info("=" * 60)
+
+        if find_category_index():
+            logger.info("\nIndex already exists")
+        else:
+            logger.info("\n[1/2] Creating index...")
+            create_category_index()
+
+        logger.info("\n[2/2] Waiting for backfill...")
+        wait_until_active()
+
+        logger.info("\n" + "=" * 60)
+        logger.info("✓ MIGRATION COMPLETE!")
+        logger.info("=" * 60)
+        logger.info("Running apps switch category listings from Scan to Query within 5 minutes")
+
+    except Exception as e:
+        logger.error(f"\n✗ Migration failed: {e}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Time-ordered order IDs
+ORD- + ULID (48-bit millisecond timestamp + 80 random bits, Crockford base32), so the
+Orders sort key sorts by creation time and time ranges become key ranges
+"""
+from datetime import datetime
+import os
+import re
+import threading
+import time
+
+ORDER_ID_PREFIX = 'ORD-'
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'  # Crockford base32
+TIME_CHARS = 10
+RANDOM_CHARS = 16
+RANDOM_BITS = 80
+
+ORDER_ID_PATTERN = re.compile(rf'^{ORDER_ID_PREFIX}[{ALPHABET}]{{{TIME_CHARS + RANDOM_CHARS}}}$')
+
+_lock = threading.Lock()
+_last_ms = -1
+_last_random = 0
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def _to_ms(moment):
+    """Epoch milliseconds for a datetime (naive = local time, like created_at) or number"""
+    if isinstance(moment, datetime):
+        return int(moment.timestamp() * 1000)
+    return int(moment * 1000)
+
+
+def new_order_id(moment=None):
+    """
+    New order ID for now (or for moment, e.g. when backfilling from created_at).
+    IDs generated in this process within the same millisecond still increase.
+    """
+    global _last_ms, _last_random
+
+    ms = _to_ms(moment) if moment is not None else int(time.time() * 1000)
+    random_part = int.from_bytes(os.urandom(RANDOM_BITS // 8), 'big')
+
+    if moment is None:
+        with _lock:
+            if ms <= _last_ms:
+                ms = _last_ms
+                random_part = (_last_random + 1) % (1 << RANDOM_BITS)
+            _last_ms, _last_random = ms, random_part
+
+    return ORDER_ID_PREFIX + _encode(ms, TIME_CHARS) + _encode(random_part, RANDOM_CHARS)
+
+
+def order_id_bound(moment, upper=False):
+    """Smallest (or with upper=True largest) order ID that can exist at moment"""
+    fill = ALPHABET[-1] if upper else ALPHABET[0]
+    return ORDER_ID_PREFIX + _encode(_to_ms(moment), TIME_CHARS) + fill * RANDOM_CHARS
+
+
+def is_time_ordered(order_id):
+    """True for IDs from new_order_id(); False for legacy ORD-<random hex> IDs"""
+    return bool(ORDER_ID_PATTERN.match(order_id or ''))
+
+
+def order_id_time(order_id):
+    """Creation time encoded in a time-ordered order ID (local naive datetime), or None"""
+    if not is_time_ordered(order_id):
+        return None
+
+    ms = 0
+    for char in order_id[len(ORDER_ID_PREFIX):len(ORDER_ID_PREFIX) + TIME_CHARS]:
+        ms = ms * 32 + ALPHABET.index(char)
+    return datetime.fromtimestamp(ms / 1000)
@@ -0,0 +1,181 @@
+"""
+Durable local job queue for post-order processing
+SQLite (WAL) file shared by the Flask workers that enqueue and the order workers that claim
+Jobs are leased, so a job held by a crashed worker becomes claimable again
+"""
+from config import Config
+from datetime import datetime
+import json
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2  # retry delay doubles per attempt
+CHECKOUT_DELAY_SECONDS = 1  # jobs queued ahead of their checkout wait this long for the order
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS order_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    order_id TEXT NOT NULL UNIQUE,
+    step INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    locked_by TEXT,
+    last_error TEXT,
+    payload TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS order_jobs_ready ON order_jobs (state, available_at);
+"""
+
+
+class OrderQueue:
+    """Queue of orders waiting for their post-order steps (one job per order)"""
+
+    def __init__(self, path, lease_seconds):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._initialized = False
+
+    def _connect(self):
+        # A short-lived connection per call keeps the queue safe across threads and processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+            self._initialized = True
+        return conn
+
+    def enqueue(self, user_id, order_id, payload=None, delay=0):
+        """
+        Queue an order for processing, claimable after delay seconds; enqueuing the
+        same order twice is a no-op. Returns True when a new job was created.
+        """
+        now = datetime.now().isoformat()
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO order_jobs "
+                "(user_id, order_id, available_at, payload, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, order_id, time.time() + delay, json.dumps(payload or {}), now, now)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def cancel(self, order_id):
+        """Drop a job that has not started, e.g. when its checkout was rejected; returns True if dropped"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "DELETE FROM order_jobs WHERE order_id = ? AND state = 'queued' AND step = 0",
+                (order_id,)
+            )
+            return cursor.rowcount > 0
+        finally:
+            conn.close()
+
+    def claim(self, worker_id):
+        """Lease the oldest ready job to worker_id; returns a dict or None"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # Jobs whose worker keeps dying mid-step stop being handed out
+            conn.execute(
+                "UPDATE order_jobs SET state = 'failed', locked_by = NULL, "
+                "last_error = COALESCE(last_error, 'Lease expired') "
+                "WHERE state = 'running' AND available_at <= ? AND attempts >= ?",
+                (now, MAX_ATTEMPTS)
+            )
+            row = conn.execute(
+                "SELECT * FROM order_jobs "
+                "WHERE state IN ('queued', 'running') AND available_at <= ? "
+                "ORDER BY available_at, id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+
+            # While leased, available_at is the lease expiry
+            conn.execute(
+                "UPDATE order_jobs SET state = 'running', locked_by = ?, available_at = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, datetime.now().isoformat(), row['id'])
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        job = dict(row)
+        job['attempts'] += 1
+        job['payload'] = json.loads(job['payload'] or '{}')
+        return job
+
+    def advance(self, job_id, worker_id, step):
+        """Record that a job finished step-1 and renew its lease"""
+        return self._update(
+            job_id, worker_id,
+            "step = ?, attempts = 0, available_at = ?",
+            (step, time.time() + self.lease_seconds)
+        )
+
+    def complete(self, job_id, worker_id):
+        """Mark a job done"""
+        return self._update(job_id, worker_id, "state = 'done', locked_by = NULL", ())
+
+    def fail(self, job_id, worker_id, error):
+        """Give up on a job; it stays in the table for inspection"""
+        return self._update(
+            job_id, worker_id, "state = 'failed', locked_by = NULL, last_error = ?", (str(error),)
+        )
+
+    def retry(self, job_id, worker_id, attempts, error):
+        """Release a failed job for a later retry, or mark it failed after MAX_ATTEMPTS"""
+        if attempts >= MAX_ATTEMPTS:
+            return self.fail(job_id, worker_id, error)
+
+        delay = RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        return self._update(
+            job_id, worker_id,
+            "state = 'queued', locked_by = NULL, last_error = ?, available_at = ?",
+            (str(error), time.time() + delay)
+        )
+
+    def _update(self, job_id, worker_id, assignments, params):
+        # Only the current lease holder may move a job; a worker whose lease expired loses it
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                f"UPDATE order_jobs SET {assignments}, updated_at = ? "
+                f"WHERE id = ? AND locked_by = ? AND state = 'running'",
+                params + (datetime.now().isoformat(), job_id, worker_id)
+            )
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Job counts by state"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT state, COUNT(*) AS jobs FROM order_jobs GROUP BY state").fetchall()
+            return {row['state']: row['jobs'] for row in rows}
+        finally:
+            conn.close()
+
+
+# Singleton instance
+order_queue = OrderQueue(Config.ORDER_QUEUE_PATH, Config.ORDER_JOB_LEASE)
@@ -0,0 +1,139 @@
+"""
+Shared plumbing for the rollups derived from orders (sales analytics, co-purchase recommendations)
+Order lines, per-order transactions made idempotent by 'applied' markers, order-aligned
+rebuild chunks, and the rebuild command line
+"""
+from aws_dynamodb import dynamodb_manager, CHECKOUT_RETRY_REASONS, BATCH_BACKOFF_SECONDS
+from config import Config
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+import argparse
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN_CATEGORY = 'uncategorized'
+APPLIED_TTL_SECONDS = 7 * 86400  # markers outlive any worker retry, then expire
+TRANSACT_ACTIONS = 100
+RECORD_ATTEMPTS = 4              # per transaction, on write conflicts and throttling
+REBUILD_CHUNK_LINES = 200000     # order lines per NumPy pass
+
+_serializer = TypeSerializer()
+
+
+def order_lines(order, categories=None):
+    """
+    Flatten an order into one dict per line: order_id, user_id, created_at, day,
+    product_id, category, name, quantity, price, revenue
+    """
+    created_at = str(order.get('created_at') or '')
+    for line in order.get('items') or []:
+        product_id = line.get('product_id')
+        if not product_id:
+            continue
+
+        quantity = int(line.get('quantity', 1))
+        price = float(line.get('price', 0))
+        category = line.get('category') or (categories or {}).get(product_id) or UNKNOWN_CATEGORY
+        yield {
+            'order_id': order['order_id'],
+            'user_id': order.get('user_id'),
+            'created_at': created_at,
+            'day': created_at[:10],
+            'product_id': product_id,
+            'category': category,
+            'name': line.get('name'),
+            'quantity': quantity,
+            'price': price,
+            'revenue': price * quantity
+        }
+
+
+def flatten_orders(orders):
+    """Stream the lines of many orders, resolving missing categories once per product"""
+    categories = {}
+    for order in orders:
+        for line in order.get('items') or []:
+            product_id = line.get('product_id')
+            if product_id and not line.get('category') and product_id not in categories:
+                categories[product_id] = dynamodb_manager.resolve_category(product_id)
+        yield from order_lines(order, categories)
+
+
+def apply_order_once(table_name, marker_key, items, build_actions, on_error=None):
+    """
+    Apply one order's updates exactly once. items are split into transactions of up to
+    TRANSACT_ACTIONS - 1 actions, each with an 'applied' marker item (key marker_key(part))
+    that turns a replay of the same order (worker retry) into a no-op.
+    build_actions(chunk) returns a chunk's actions and is called again per attempt, so
+    callers can re-draw write shards; conflicts and throttling are retried with backoff.
+    on_error(error, chunk) may repair the cause of another failure and return True to retry.
+    Returns the number of transactions applied by this call.
+    """
+    applied = 0
+    per_transaction = TRANSACT_ACTIONS - 1
+    for part, start in enumerate(range(0, len(items), per_transaction)):
+        chunk = items[start:start + per_transaction]
+        key = marker_key(part)
+        marker = {
+            'Put': {
+                'TableName': table_name,
+                'Item': {k: _serializer.serialize(v) for k, v in
+                         dict(key, expires_at=int(time.time()) + APPLIED_TTL_SECONDS).items()},
+                'ConditionExpression': 'attribute_not_exists(#k)',
+                'ExpressionAttributeNames': {'#k': next(iter(key))}
+            }
+        }
+        for attempt in range(RECORD_ATTEMPTS):
+            try:
+                dynamodb_manager.dynamodb_client.transact_write_items(
+                    TransactItems=[marker] + build_actions(chunk)
+                )
+                applied += 1
+                break
+            except ClientError as e:
+                reasons = e.response.get('CancellationReasons') or [{}]
+                if reasons[0].get('Code') == 'ConditionalCheckFailed':
+                    break  # Already applied by an earlier attempt
+                busy = not {reason.get('Code') for reason in reasons}.isdisjoint(CHECKOUT_RETRY_REASONS)
+                if attempt == RECORD_ATTEMPTS - 1 or not (busy or (on_error and on_error(e, chunk))):
+                    raise
+            time.sleep(random.uniform(0, BATCH_BACKOFF_SECONDS * (2 ** attempt)))
+    return applied
+
+
+def chunks_by_order(lines, size=REBUILD_CHUNK_LINES):
+    """
+    Group a stream of order lines into lists of about size lines, cutting only between
+    orders (lines of one order must be adjacent, as flatten_orders() yields them)
+    """
+    chunk = []
+    for line in lines:
+        if len(chunk) >= size and line['order_id'] != chunk[-1]['order_id']:
+            yield chunk
+            chunk = []
+        chunk.append(line)
+    if chunk:
+        yield chunk
+
+
+def rebuild_main(description, name, rebuild):
+    """Command line for a rollup rebuild: rebuild(lines) from Orders or an export_orders.py export"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('command', choices=['rebuild'])
+    parser.add_argument('--from-export', metavar='DIR',
+                        help='read order lines from export_orders.py output instead of scanning Orders')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.from_export:
+        from export_orders import read_export
+        logger.info(f"Rebuilding {name} from export {args.from_export}...")
+        lines = read_export(args.from_export)
+    else:
+        logger.info(f"Rebuilding {name} from the Orders table...")
+        lines = flatten_orders(dynamodb_manager.parallel_scan(Config.DYNAMODB_ORDERS_TABLE))
+    rebuild(lines)
+    logger.info(f"✓ {name.capitalize()} rebuilt")
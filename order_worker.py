@@ -0,0 +1,176 @@
+"""
+Post-order worker pool
+Claims jobs from the order queue and moves each order through its pipeline statuses
+Run: python order_worker.py [--workers N]
+"""
+from config import Config
+from order_queue import order_queue
+from datetime import datetime
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 1.0  # idle wait between empty claims
+
+
+class OrderGone(Exception):
+    """The order behind a job no longer exists"""
+
+
+# Pipeline steps, run in order: (name, handler, status the order moves to, or None)
+# Handlers receive the order and the job payload, and must be safe to run twice
+
+def accept_order(order, payload):
+    """Confirm the order is still there and its lines look sane before fulfilment"""
+    if not order.get('items'):
+        raise ValueError(f"Order {order['order_id']} has no items")
+
+
+def record_sales(order, payload):
+    """
+    Add the order to the sales analytics rollups (idempotent per order).
+    Best effort: a failure here must not hold the order back from being confirmed.
+    """
+    from analytics import sales_analytics
+    try:
+        sales_analytics.record_order(order)
+    except Exception as e:
+        logger.error(f"Error recording sales for order {order['order_id']}: {e}")
+
+
+def record_copurchases(order, payload):
+    """
+    Add the order's product pairs to the co-purchase recommendations (idempotent per order).
+    Best effort: a failure here must not hold the order back from being confirmed.
+    """
+    from recommendations import recommendations
+    try:
+        recommendations.record_order(order)
+    except Exception as e:
+        logger.error(f"Error recording co-purchases for order {order['order_id']}: {e}")
+
+
+def notify_customer(order, payload):
+    """Order confirmation (no mail provider is configured; log it)"""
+    logger.info(f"Order {order['order_id']} confirmed for user {order['user_id']}")
+
+
+ORDER_PIPELINE = [
+    ('accept', accept_order, 'processing'),
+    ('analytics', record_sales, None),
+    ('recommendations', record_copurchases, None),
+    ('notify', notify_customer, 'confirmed'),
+]
+
+
+def run_job(dynamodb_manager, job, worker_id):
+    """Run the remaining pipeline steps of one job, recording progress after each step"""
+    for step in range(job['step'], len(ORDER_PIPELINE)):
+        name, handler, status = ORDER_PIPELINE[step]
+
+        order = dynamodb_manager.get_order(job['user_id'], job['order_id'])
+        if not order:
+            # Jobs are queued before their checkout commits: a young job may just be early
+            age = (datetime.now() - datetime.fromisoformat(job['created_at'])).total_seconds()
+            if step == 0 and age < Config.ORDER_PENDING_GRACE:
+                raise RuntimeError(f"Order {job['order_id']} not written yet")
+            raise OrderGone(f"Order {job['order_id']} not found")
+
+        if status is None:
+            handler(order, job['payload'])
+        elif order.get('status') != status:
+            # A replayed step whose status already moved on is skipped, not re-run
+            handler(order, job['payload'])
+            updated = dynamodb_manager.update_order_status(
+                job['user_id'], job['order_id'], status, expected_status=order.get('status')
+            )
+            if updated is None:
+                raise RuntimeError(f"Order {job['order_id']} changed during step '{name}'")
+
+        if not order_queue.advance(job['id'], worker_id, step + 1):
+            raise RuntimeError(f"Lost lease on order {job['order_id']}")
+
+
+def work(stop_event):
+    """Worker process loop: claim, run, complete or retry, until stop_event is set"""
+    # Imported here so each (spawned) process opens its own AWS session
+    from aws_dynamodb import dynamodb_manager
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    # Finish the current job on shutdown; the parent relays Ctrl+C through stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    logger.info(f"Order worker {worker_id} started")
+
+    while not stop_event.is_set():
+        try:
+            job = order_queue.claim(worker_id)
+        except Exception as e:
+            logger.error(f"Error claiming order job: {e}")
+            stop_event.wait(POLL_SECONDS)
+            continue
+
+        if job is None:
+            stop_event.wait(POLL_SECONDS)
+            continue
+
+        try:
+            run_job(dynamodb_manager, job, worker_id)
+            order_queue.complete(job['id'], worker_id)
+            logger.info(f"Order {job['order_id']} processed")
+        except OrderGone as e:
+            logger.warning(str(e))
+            order_queue.fail(job['id'], worker_id, e)
+        except Exception as e:
+            logger.error(f"Error processing order {job['order_id']} (attempt {job['attempts']}): {e}")
+            order_queue.retry(job['id'], worker_id, job['attempts'], e)
+
+    logger.info(f"Order worker {worker_id} stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process queued orders')
+    parser.add_argument('--workers', type=int, default=Config.ORDER_WORKERS,
+                        help='number of worker processes')
+    args = parser.parse_args()
+
+    # spawn, not fork: boto3 sessions and SQLite handles must not cross a fork
+    context = multiprocessing.get_context('spawn')
+    stop_event = context.Event()
+    processes = [
+        context.Process(target=work, args=(stop_event,), name=f'order-worker-{i + 1}')
+        for i in range(max(1, args.workers))
+    ]
+
+    def shutdown(signum, frame):
+        if not stop_event.is_set():
+            logger.info("Stopping order workers after their current job...")
+            stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    # One inventory rebalancer per worker host
+    from aws_dynamodb import dynamodb_manager
+    dynamodb_manager.inventory.start_rebalancer()
+
+    logger.info(f"Starting {len(processes)} order workers on {Config.ORDER_QUEUE_PATH}")
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    logger.info(f"Queue: {order_queue.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Sorted product indexes for price range filtering and price/newest sorting
+Per-category sorted arrays searched with bisect: O(log n + page) per page; newest within
+a price range walks creation order or heap-selects the range, whichever is cheaper
+"""
+from catalog_index import CatalogIndex
+from bisect import bisect_left, bisect_right, insort
+import heapq
+
+SORT_OPTIONS = ('price_asc', 'price_desc', 'newest')
+
+# Sorts after every product_id, so (max_price, MAX_ID) bounds an inclusive range
+MAX_ID = '\U0010ffff'
+
+
+class ProductPriceIndex(CatalogIndex):
+    """(price, product_id) and (created_at, product_id) arrays per category and for the whole catalog"""
+
+    def _clear(self):
+        self._by_price = {None: []}    # category (None = all) -> sorted (price, product_id)
+        self._by_created = {None: []}  # category (None = all) -> sorted (created_at, product_id)
+        self._products = {}            # product_id -> product
+
+    def _entries(self, product):
+        """(category, price entry, created entry) for a product, or None without a valid price"""
+        try:
+            price = float(product.get('price'))
+        except (TypeError, ValueError):
+            return None
+
+        product_id = product['product_id']
+        return product.get('category'), (price, product_id), (product.get('created_at') or '', product_id)
+
+    def _add(self, product):
+        entries = self._entries(product)
+        if entries is None:
+            return
+
+        category, price_entry, created_entry = entries
+        for key in (None, category):
+            insort(self._by_price.setdefault(key, []), price_entry)
+            insort(self._by_created.setdefault(key, []), created_entry)
+        self._products[product['product_id']] = product
+
+    def _load(self, products):
+        # Collect per category and sort each array once instead of an insort per product
+        for product in products:
+            entries = self._entries(product)
+            if entries is None:
+                continue
+
+            category, price_entry, created_entry = entries
+            for key in (None, category):
+                self._by_price.setdefault(key, []).append(price_entry)
+                self._by_created.setdefault(key, []).append(created_entry)
+            self._products[product['product_id']] = product
+
+        for arrays in (self._by_price, self._by_created):
+            for entries in arrays.values():
+                entries.sort()
+
+    def _remove(self, product_id):
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return
+
+        price_entry = (float(product.get('price')), product_id)
+        created_entry = (product.get('created_at') or '', product_id)
+        for key in (None, product.get('category')):
+            for entries, entry in ((self._by_price[key], price_entry), (self._by_created[key], created_entry)):
+                i = bisect_left(entries, entry)
+                if i < len(entries) and entries[i] == entry:
+                    del entries[i]
+
+    def query(self, category=None, min_price=None, max_price=None, sort='price_asc', offset=0, limit=12):
+        """Return (products, total matches) for one page of a filtered, sorted listing"""
+        if sort not in SORT_OPTIONS:
+            raise ValueError(f"sort must be one of: {', '.join(SORT_OPTIONS)}")
+
+        self.ensure_built()
+
+        with self._lock:
+            by_price = self._by_price.get(category, [])
+            lo = bisect_left(by_price, (min_price,)) if min_price is not None else 0
+            hi = bisect_right(by_price, (max_price, MAX_ID)) if max_price is not None else len(by_price)
+            total = max(hi - lo, 0)
+
+            if sort == 'price_asc':
+                page = by_price[lo + offset:min(hi, lo + offset + limit)]
+            elif sort == 'price_desc':
+                end = hi - offset
+                page = by_price[max(lo, end - limit):max(lo, end)][::-1]
+            elif min_price is None and max_price is None:
+                by_created = self._by_created.get(category, [])
+                end = len(by_created) - offset
+                page = by_created[max(0, end - limit):max(0, end)][::-1]
+            else:
+                page = self._newest_in_range(category, lo, hi, min_price, max_price, offset + limit)[offset:]
+
+            return [self._products[product_id] for _, product_id in page], total
+
+    def _newest_in_range(self, category, lo, hi, min_price, max_price, count):
+        """
+        The count newest products in by_price[lo:hi], newest first, by the cheaper of:
+        walking the creation-order array newest-first, skipping other prices (about
+        count * n / k steps for k matches of n), or selecting from the k matches with a
+        heap of size count (k log count)
+        """
+        by_created = self._by_created.get(category, [])
+        matched = hi - lo
+        if matched <= 0 or count <= 0:
+            return []
+
+        if count * len(by_created) < matched * matched:
+            page = []
+            for created_at, product_id in reversed(by_created):
+                price = float(self._products[product_id].get('price'))
+                if (min_price is None or price >= min_price) and (max_price is None or price <= max_price):
+                    page.append((created_at, product_id))
+                    if len(page) == count:
+                        break
+            return page
+
+        by_price = self._by_price[category]
+        return heapq.nlargest(
+            count,
+            ((self._products[by_price[i][1]].get('created_at') or '', by_price[i][1]) for i in range(lo, hi))
+        )
+
+
+# Singleton instance
+price_index = ProductPriceIndex()
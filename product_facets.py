@@ -0,0 +1,99 @@
+"""
+Faceted browse data for the catalog sidebar
+Per-category counts, price ranges and price-band histograms, computed with NumPy
+"""
+from catalog_index import CatalogIndex
+from config import Config
+import numpy as np
+
+
+def parse_price_edges(value):
+    """Parse comma-separated ascending bucket edges ('0,500000,1000000')"""
+    edges = sorted({float(edge) for edge in value.split(',') if edge.strip()})
+    if not edges:
+        raise ValueError("PRICE_FACET_EDGES must contain at least one edge")
+    return edges
+
+
+class ProductFacetIndex(CatalogIndex):
+    """Keeps (category, price) per product; facets are recomputed vectorised after a change"""
+
+    def __init__(self, price_edges=None, refresh_seconds=None):
+        self.price_edges = np.array(price_edges or parse_price_edges(Config.PRICE_FACET_EDGES))
+        super().__init__(refresh_seconds=refresh_seconds)
+
+    def _clear(self):
+        self._products = {}   # product_id -> (category, price)
+        self._facets = None   # computed facets, None when stale
+
+    def _add(self, product):
+        try:
+            price = float(product.get('price'))
+        except (TypeError, ValueError):
+            return
+        self._products[product['product_id']] = (product.get('category') or '', price)
+        self._facets = None
+
+    def _remove(self, product_id):
+        if self._products.pop(product_id, None) is not None:
+            self._facets = None
+
+    def _buckets(self, counts):
+        """Pair histogram counts with their [min, max) price band; the last band is open-ended"""
+        edges = self.price_edges.tolist()
+        return [
+            {'min': edges[i], 'max': edges[i + 1] if i + 1 < len(edges) else None, 'count': int(count)}
+            for i, count in enumerate(counts)
+        ]
+
+    def _compute(self):
+        if not self._products:
+            return {'total': 0, 'price': None, 'price_buckets': self._buckets([0] * len(self.price_edges)),
+                    'categories': []}
+
+        categories, prices = zip(*self._products.values())
+        prices = np.fromiter(prices, dtype=np.float64, count=len(prices))
+        names, codes = np.unique(np.array(categories, dtype=object), return_inverse=True)
+
+        n_categories = len(names)
+        n_buckets = len(self.price_edges)
+
+        # Prices below the first edge are clamped into the first band
+        buckets = np.clip(np.searchsorted(self.price_edges, prices, side='right') - 1, 0, n_buckets - 1)
+
+        counts = np.bincount(codes, minlength=n_categories)
+        histogram = np.bincount(codes * n_buckets + buckets, minlength=n_categories * n_buckets)
+        histogram = histogram.reshape(n_categories, n_buckets)
+
+        min_prices = np.full(n_categories, np.inf)
+        max_prices = np.full(n_categories, -np.inf)
+        np.minimum.at(min_prices, codes, prices)
+        np.maximum.at(max_prices, codes, prices)
+
+        return {
+            'total': int(prices.size),
+            'price': {'min': float(prices.min()), 'max': float(prices.max())},
+            'price_buckets': self._buckets(histogram.sum(axis=0)),
+            'categories': [
+                {
+                    'category': str(names[i]),
+                    'count': int(counts[i]),
+                    'min_price': float(min_prices[i]),
+                    'max_price': float(max_prices[i]),
+                    'price_buckets': self._buckets(histogram[i])
+                }
+                for i in np.argsort(-counts, kind='stable')
+            ]
+        }
+
+    def facets(self):
+        """Return category counts, price range and price-band histograms for the catalog"""
+        self.ensure_built()
+        with self._lock:
+            if self._facets is None:
+                self._facets = self._compute()
+            return self._facets
+
+
+# Singleton instance
+facet_index = ProductFacetIndex()
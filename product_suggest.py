@@ -0,0 +1,140 @@
+"""
+Typeahead suggestions for the header search box
+Sorted array of normalized name/category keys, searched with bisect; keystrokes never
+wait on the catalog read, the index builds in the background
+"""
+from catalog_index import CatalogIndex
+from search_index import normalize, TOKEN_PATTERN
+from bisect import bisect_left, insort
+from collections import Counter
+
+DEFAULT_SUGGESTIONS = 8
+MAX_SUGGESTIONS = 20
+
+# Entry ranks: categories first, then names starting with the prefix, then inner-word matches
+RANK_CATEGORY = 0
+RANK_NAME = 1
+RANK_WORD = 2
+
+
+def suggest_key(text):
+    """Normalize text into a space-separated key ('MacBook Pro 14"' -> 'macbook pro 14')"""
+    return ' '.join(TOKEN_PATTERN.findall(normalize(text)))
+
+
+class ProductSuggestIndex(CatalogIndex):
+    """Prefix lookups over product names and categories in O(log n + k)"""
+
+    def _clear(self):
+        # Sorted (key, rank, text, product_id, category) tuples; bisect on (prefix,)
+        self._entries = []
+        self._product_entries = {}     # product_id -> entries, for removal
+        self._product_categories = {}  # product_id -> category, for the category count
+        self._categories = Counter()   # category -> number of products
+
+    def _insert(self, entry):
+        insort(self._entries, entry)
+
+    def _delete(self, entry):
+        i = bisect_left(self._entries, entry)
+        if i < len(self._entries) and self._entries[i] == entry:
+            del self._entries[i]
+
+    def _index_product(self, product):
+        """Record a product's name entries and category; returns (entries, category)"""
+        product_id = product['product_id']
+        name = product.get('name') or ''
+        category = product.get('category') or ''
+
+        # Index the full name plus every inner word start, so 'pro' finds 'MacBook Pro'
+        words = suggest_key(name).split(' ')
+        entries = []
+        for i in range(len(words)):
+            key = ' '.join(words[i:])
+            if key:
+                entries.append((key, RANK_NAME if i == 0 else RANK_WORD, name, product_id, category))
+
+        entries = list(dict.fromkeys(entries))
+        self._product_entries[product_id] = entries
+        self._product_categories[product_id] = category
+        return entries, category
+
+    def _add(self, product):
+        entries, category = self._index_product(product)
+        for entry in entries:
+            self._insert(entry)
+
+        if category:
+            if self._categories[category] == 0:
+                self._insert((suggest_key(category), RANK_CATEGORY, category, '', category))
+            self._categories[category] += 1
+
+    def _load(self, products):
+        # One sort over the whole catalog instead of an insort per entry
+        for product in products:
+            entries, category = self._index_product(product)
+            self._entries.extend(entries)
+            if category:
+                self._categories[category] += 1
+        self._entries.extend(
+            (suggest_key(category), RANK_CATEGORY, category, '', category) for category in self._categories
+        )
+        self._entries.sort()
+
+    def _remove(self, product_id):
+        entries = self._product_entries.pop(product_id, None)
+        if entries is None:
+            return
+
+        for entry in entries:
+            self._delete(entry)
+
+        category = self._product_categories.pop(product_id, '')
+        if category:
+            self._categories[category] -= 1
+            if self._categories[category] <= 0:
+                del self._categories[category]
+                self._delete((suggest_key(category), RANK_CATEGORY, category, '', category))
+
+    def suggest(self, prefix, limit=DEFAULT_SUGGESTIONS):
+        """Return up to limit suggestion dicts for a typed prefix (none until the index is built)"""
+        prefix = suggest_key(prefix)
+        if not prefix or not self.ensure_built(wait=False):
+            return []
+
+        # Ranking is only applied within a bounded window of matches to keep lookups flat
+        window = max(limit * 8, 64)
+
+        with self._lock:
+            matches = []
+            i = bisect_left(self._entries, (prefix,))
+            while i < len(self._entries) and len(matches) < window:
+                entry = self._entries[i]
+                if not entry[0].startswith(prefix):
+                    break
+                matches.append(entry)
+                i += 1
+
+        matches.sort(key=lambda entry: (entry[1], len(entry[2]), entry[2]))
+
+        suggestions = []
+        seen = set()
+        for key, rank, text, product_id, category in matches:
+            ref = product_id or ('category', category)
+            if ref in seen:
+                continue
+            seen.add(ref)
+
+            if rank == RANK_CATEGORY:
+                suggestions.append({'type': 'category', 'text': text, 'category': category})
+            else:
+                suggestions.append({'type': 'product', 'text': text,
+                                    'product_id': product_id, 'category': category})
+            if len(suggestions) >= limit:
+                break
+
+        return suggestions
+
+
+# Singleton instance
+suggest_index = ProductSuggestIndex()
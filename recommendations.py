@@ -0,0 +1,327 @@
+"""
+Co-purchase recommendations ("customers also bought")
+A sparse product x product co-occurrence matrix built from order lines with NumPy
+(COO pair keys counted with np.unique), trimmed to the top neighbours per product and
+stored in the Recommendations table. The order workers add each new order's pairs
+incrementally and trim touched products back to the top neighbours; the web app serves
+lookups from an in-process cache.
+Run: python recommendations.py rebuild [--from-export exports/2026-03]
+"""
+from aws_dynamodb import dynamodb_manager
+from order_rollups import apply_order_once, chunks_by_order, rebuild_main
+from config import Config
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from datetime import datetime
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+APPLIED_PREFIX = 'applied#'     # marker items making incremental updates idempotent
+MAX_ORDER_PRODUCTS = 40         # products of one order paired incrementally (4 KB expression limit)
+TRIM_REMOVE_BATCH = 40          # neighbours removed per conditional UpdateItem
+PAIR_SHIFT = np.int64(32)       # pair key = row << 32 | column
+PAIR_MASK = np.int64(0xFFFFFFFF)
+
+
+def order_pairs(order_codes, product_codes):
+    """
+    Co-occurrence pairs of a chunk of order lines, as sorted unique pair keys and counts.
+    Each order counts once per product pair, however many lines or units it has.
+    """
+    # One entry per (order, product), sorted by order
+    lines = np.unique(np.stack([order_codes, product_codes], axis=1), axis=0)
+    orders, products = lines[:, 0], lines[:, 1]
+
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+
+    # Pair every line with every line of its order: line i repeats once per order member
+    repeats = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(products)), repeats)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+    right = np.repeat(np.repeat(starts, sizes), repeats) + offsets
+
+    keep = left != right
+    keys = (products[left[keep]].astype(np.int64) << PAIR_SHIFT) | products[right[keep]].astype(np.int64)
+    return np.unique(keys, return_counts=True)
+
+
+def merge_pairs(keys, counts, more_keys, more_counts):
+    """Sum two sparse pair-count vectors"""
+    merged, codes = np.unique(np.concatenate([keys, more_keys]), return_inverse=True)
+    sums = np.bincount(codes, weights=np.concatenate([counts, more_counts]), minlength=len(merged))
+    return merged, sums.astype(np.int64)
+
+
+def top_neighbours(keys, counts, limit):
+    """Rows, columns and counts of the top `limit` columns per row (ties by column)"""
+    rows = keys >> PAIR_SHIFT
+    columns = keys & PAIR_MASK
+    order = np.lexsort((columns, -counts, rows))
+    rows, columns, counts = rows[order], columns[order], counts[order]
+
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else np.array([], dtype=np.int64)
+    sizes = np.diff(np.r_[starts, len(rows)])
+    rank = np.arange(len(rows)) - np.repeat(starts, sizes)
+    keep = rank < limit
+    return rows[keep], columns[keep], counts[keep]
+
+
+class CoPurchaseRecommendations:
+    """Top co-purchased products per product, with an LRU + TTL lookup cache in process"""
+
+    def __init__(self, max_neighbours, cache_ttl, max_entries):
+        self.max_neighbours = max_neighbours
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._serializer = TypeSerializer()
+        self._cache = OrderedDict()  # product_id -> (expires_at, [(product_id, count), ...])
+        self._lock = threading.Lock()
+
+    def _table(self):
+        return dynamodb_manager.dynamodb_resource.Table(Config.DYNAMODB_RECOMMENDATIONS_TABLE)
+
+    def _serialize(self, value):
+        return {k: self._serializer.serialize(v) for k, v in value.items()}
+
+    # Lookups
+
+    def related(self, product_id, limit=None):
+        """[(product_id, orders bought together), ...], most co-purchased first"""
+        with self._lock:
+            cached = self._cache.get(product_id)
+            if cached and cached[0] > time.monotonic():
+                self._cache.move_to_end(product_id)
+                return cached[1][:limit]
+
+        item = self._table().get_item(
+            Key={'product_id': product_id},
+            ProjectionExpression='neighbours'
+        ).get('Item') or {}
+        neighbours = sorted(
+            ((other, int(count)) for other, count in (item.get('neighbours') or {}).items()),
+            key=lambda pair: (-pair[1], pair[0])
+        )
+
+        with self._lock:
+            self._cache[product_id] = (time.monotonic() + self.cache_ttl, neighbours)
+            self._cache.move_to_end(product_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return neighbours[:limit]
+
+    def invalidate(self, product_id=None):
+        with self._lock:
+            if product_id is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(product_id, None)
+
+    # Incremental updates
+
+    def record_order(self, order):
+        """
+        Add one order's product pairs, then trim the touched products to max_neighbours.
+        Each transaction also writes an 'applied' marker, so replaying the same order
+        (worker retry) never counts it twice. Only the first MAX_ORDER_PRODUCTS distinct
+        products of a very large order are paired; a rebuild counts them all.
+        """
+        products = list(dict.fromkeys(
+            line['product_id'] for line in order.get('items') or [] if line.get('product_id')
+        ))[:MAX_ORDER_PRODUCTS]
+        if len(products) < 2:
+            return 0
+
+        now = datetime.now().isoformat()
+
+        def increments(chunk):
+            updates = []
+            for product_id in chunk:
+                others = [other for other in products if other != product_id]
+                names = {'#n': 'neighbours', '#orders': 'orders', '#updated': 'updated_at'}
+                assignments = []
+                for index, other in enumerate(others):
+                    names[f'#p{index}'] = other
+                    assignments.append(f'#n.#p{index} = if_not_exists(#n.#p{index}, :zero) + :one')
+                updates.append({
+                    'Update': {
+                        'TableName': Config.DYNAMODB_RECOMMENDATIONS_TABLE,
+                        'Key': self._serialize({'product_id': product_id}),
+                        'UpdateExpression': f"SET #updated = :now, {', '.join(assignments)} ADD #orders :one",
+                        'ExpressionAttributeNames': names,
+                        'ExpressionAttributeValues': self._serialize({':zero': 0, ':one': 1, ':now': now})
+                    }
+                })
+            return updates
+
+        def add_missing_maps(error, chunk):
+            # First co-purchase of some product: give it an empty neighbours map and retry
+            if not self._missing_map(error):
+                return False
+            self._ensure_rows(chunk)
+            return True
+
+        order_id = order['order_id']
+        applied = apply_order_once(
+            Config.DYNAMODB_RECOMMENDATIONS_TABLE,
+            lambda part: {'product_id': f"{APPLIED_PREFIX}{order_id}#{part}"},
+            products,
+            increments,
+            on_error=add_missing_maps
+        )
+
+        if applied:
+            self._trim(products)
+            for product_id in products:
+                self.invalidate(product_id)
+        return applied
+
+    def _trim(self, product_ids):
+        """
+        Drop the least co-purchased neighbours of products holding more than max_neighbours.
+        Each removal is conditional on the counts read, so a racing increment is never lost
+        (the next order touching the product trims it instead).
+        """
+        table_name = Config.DYNAMODB_RECOMMENDATIONS_TABLE
+        response = dynamodb_manager.dynamodb_resource.batch_get_item(RequestItems={
+            table_name: {
+                'Keys': [{'product_id': product_id} for product_id in product_ids],
+                'ProjectionExpression': 'product_id, neighbours'
+            }
+        })
+
+        table = self._table()
+        for item in response.get('Responses', {}).get(table_name, []):
+            neighbours = item.get('neighbours') or {}
+            if len(neighbours) <= self.max_neighbours:
+                continue
+
+            ranked = sorted(neighbours.items(), key=lambda pair: (-int(pair[1]), pair[0]))
+            drop = ranked[self.max_neighbours:]
+            for start in range(0, len(drop), TRIM_REMOVE_BATCH):
+                names = {'#n': 'neighbours'}
+                values = {}
+                removals = []
+                conditions = []
+                for index, (other, count) in enumerate(drop[start:start + TRIM_REMOVE_BATCH]):
+                    names[f'#r{index}'] = other
+                    values[f':c{index}'] = count
+                    removals.append(f'#n.#r{index}')
+                    conditions.append(f'#n.#r{index} = :c{index}')
+                try:
+                    table.update_item(
+                        Key={'product_id': item['product_id']},
+                        UpdateExpression='REMOVE ' + ', '.join(removals),
+                        ConditionExpression=' AND '.join(conditions),
+                        ExpressionAttributeNames=names,
+                        ExpressionAttributeValues=values
+                    )
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                    break
+
+    @staticmethod
+    def _missing_map(error):
+        """True when an update failed because an item has no neighbours map yet"""
+        if error.response['Error']['Code'] == 'ValidationException':
+            return True
+        reasons = error.response.get('CancellationReasons') or []
+        return any(reason.get('Code') == 'ValidationError' for reason in reasons)
+
+    def _ensure_rows(self, product_ids):
+        table = self._table()
+        for product_id in product_ids:
+            table.update_item(
+                Key={'product_id': product_id},
+                UpdateExpression='SET neighbours = if_not_exists(neighbours, :empty)',
+                ExpressionAttributeValues={':empty': {}}
+            )
+
+    # Bulk rebuild
+
+    def rebuild(self, lines):
+        """
+        Recompute the co-occurrence matrix from a stream of order lines (see order_lines)
+        chunk by chunk, keep the top max_neighbours per product and replace the table.
+        Lines of one order must be adjacent, as flatten_orders() yields them.
+        Stop the order workers while this runs, or their increments may be lost.
+        """
+        product_index = {}   # product_id -> matrix row/column
+        order_counts = np.array([], dtype=np.int64)  # orders containing each product
+        keys = np.array([], dtype=np.int64)
+        counts = np.array([], dtype=np.int64)
+        line_count = 0
+
+        # Chunks cut only between orders, so every pair of an order lands in one chunk
+        for chunk in chunks_by_order(lines):
+            order_codes = np.unique(np.array([line['order_id'] for line in chunk], dtype=object),
+                                    return_inverse=True)[1]
+            product_codes = np.fromiter(
+                (product_index.setdefault(line['product_id'], len(product_index)) for line in chunk),
+                dtype=np.int64, count=len(chunk)
+            )
+            ordered = np.unique(np.stack([order_codes, product_codes], axis=1), axis=0)[:, 1]
+            order_counts = np.pad(order_counts, (0, len(product_index) - len(order_counts)))
+            order_counts += np.bincount(ordered, minlength=len(product_index))
+            chunk_keys, chunk_counts = order_pairs(order_codes, product_codes)
+            keys, counts = merge_pairs(keys, counts, chunk_keys, chunk_counts)
+            line_count += len(chunk)
+
+        product_ids = list(product_index)
+        rows, columns, top_counts = top_neighbours(keys, counts, self.max_neighbours)
+        neighbours = {product_id: {} for product_id in product_ids}
+        for row, column, count in zip(rows.tolist(), columns.tolist(), top_counts.tolist()):
+            neighbours[product_ids[row]][product_ids[column]] = count
+
+        written = self._replace(neighbours, dict(zip(product_ids, order_counts.tolist())))
+        self.invalidate()
+        logger.info(f"Recommendations rebuilt from {line_count} order lines "
+                    f"({len(keys)} product pairs, {written} products)")
+        return written
+
+    def _replace(self, neighbours, order_counts):
+        """Overwrite stored neighbours and delete products that no longer have any orders"""
+        table = self._table()
+        existing = set()
+        for item in dynamodb_manager.parallel_scan(
+            Config.DYNAMODB_RECOMMENDATIONS_TABLE,
+            ProjectionExpression='product_id'
+        ):
+            if not item['product_id'].startswith(APPLIED_PREFIX):
+                existing.add(item['product_id'])
+
+        now = datetime.now().isoformat()
+        with table.batch_writer(overwrite_by_pkeys=['product_id']) as batch:
+            for product_id, row in neighbours.items():
+                batch.put_item(Item={
+                    'product_id': product_id,
+                    'neighbours': row,
+                    'orders': order_counts.get(product_id, 0),
+                    'updated_at': now
+                })
+            for product_id in existing - set(neighbours):
+                batch.delete_item(Key={'product_id': product_id})
+
+        return len(neighbours)
+
+
+# Singleton instance
+recommendations = CoPurchaseRecommendations(
+    max_neighbours=Config.RECOMMENDATIONS_MAX_NEIGHBOURS,
+    cache_ttl=Config.RECOMMENDATIONS_CACHE_TTL,
+    max_entries=Config.RECOMMENDATIONS_CACHE_MAX_ENTRIES
+)
+
+
+def main():
+    rebuild_main('Co-purchase recommendations', 'recommendations', recommendations.rebuild)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 Clear all products from DynamoDB and reseed with new data
 """
 from aws_dynamodb import dynamodb_manager
+from config import Config
 from seed_data import seed_products, PRODUCTS
 import logging
 
@@ -13,7 +14,11 @@ def clear_all_products():
     """Delete all existing products"""
     try:
         logger.info("Fetching all existing products...")
-        products = dynamodb_manager.get_all_products()
+        products = list(dynamodb_manager.parallel_scan(
+            Config.DYNAMODB_PRODUCTS_TABLE,
+            ProjectionExpression='product_id, category, #n',
+            ExpressionAttributeNames={'#n': 'name'}
+        ))
         
         if not products:
             logger.info("No products to delete")
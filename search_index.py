@@ -0,0 +1,134 @@
+"""
+In-memory full-text product search
+Inverted index over name, description and category with BM25 ranking
+Tokenizer handles the mixed Indonesian/English product copy
+"""
+from catalog_index import CatalogIndex
+import math
+import re
+import unicodedata
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+STOPWORDS = {
+    # English
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'the', 'to', 'up', 'with', 'your',
+    # Indonesian
+    'ada', 'adalah', 'agar', 'akan', 'atau', 'banget', 'bisa', 'buat', 'dan', 'dari',
+    'dengan', 'di', 'hingga', 'ini', 'itu', 'juga', 'ke', 'lebih', 'pada', 'sangat',
+    'sudah', 'untuk', 'yang',
+}
+
+# Indonesian enclitics/particles glued onto words ("kencangnya", "cocoklah")
+PARTICLE_SUFFIXES = ('nya', 'lah', 'kah', 'pun')
+
+# Field weights for BM25F-style term frequencies
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Café' and 'cafe' compare equal"""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Lowercase, strip accents, split on non-alphanumerics, drop stopwords and particles"""
+    if not text:
+        return []
+
+    tokens = []
+    for token in TOKEN_PATTERN.findall(normalize(text)):
+        if token in STOPWORDS:
+            continue
+        for suffix in PARTICLE_SUFFIXES:
+            if token.endswith(suffix) and len(token) - len(suffix) >= 4 and token.isalpha():
+                token = token[:-len(suffix)]
+                break
+        tokens.append(token)
+    return tokens
+
+
+class ProductSearchIndex(CatalogIndex):
+    """Inverted index with BM25 scoring over the product catalog"""
+
+    def _clear(self):
+        self._postings = {}       # term -> {product_id: weighted term frequency}
+        self._doc_lengths = {}    # product_id -> weighted document length
+        self._doc_terms = {}      # product_id -> terms, for removal
+        self._products = {}       # product_id -> product dict returned in results
+        self._total_length = 0.0
+
+    def _add(self, product):
+        product_id = product['product_id']
+
+        frequencies = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(product.get(field)):
+                frequencies[token] += weight
+
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[product_id] = frequency
+
+        length = sum(frequencies.values())
+        self._doc_lengths[product_id] = length
+        self._doc_terms[product_id] = tuple(frequencies)
+        self._products[product_id] = product
+        self._total_length += length
+
+    def _remove(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self._postings[term]
+
+        self._total_length -= self._doc_lengths.pop(product_id)
+        del self._products[product_id]
+
+    def search(self, query, limit=20, category=None):
+        """Return up to limit (product, score) pairs ranked by BM25"""
+        self.ensure_built()
+
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._doc_lengths)
+            if doc_count == 0:
+                return []
+            avg_length = self._total_length / doc_count
+
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+
+                idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for product_id, frequency in postings.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[product_id] / avg_length)
+                    scores[product_id] = scores.get(product_id, 0.0) + \
+                        idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+            if category:
+                scores = {pid: s for pid, s in scores.items()
+                          if self._products[pid].get('category') == category}
+
+            ranked = sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:limit]
+            return [(self._products[pid], score) for pid, score in ranked]
+
+
+# Singleton instance
+search_index = ProductSearchIndex()